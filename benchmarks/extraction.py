@@ -0,0 +1,231 @@
+"""Benchmark of the yt_dlp extraction profiles: per-call latency and CPU time of 'default' vs 'fast'.
+
+By default the youtube extractor's network requests are replaced by a synthetic response with a
+realistic format list(plus HLS manifest formats unless the profile skips them), which measures
+the work yt_dlp does in the bot's process: finding the extractor, processing and sorting the
+formats and picking the stream. With `--url` real videos are extracted instead, which needs
+network access. Run from the repository root:
+
+    python -m benchmarks.extraction --calls 200
+    python -m benchmarks.extraction --calls 5 --url https://www.youtube.com/watch?v=dQw4w9WgXcQ
+"""
+
+from argparse import ArgumentParser
+from json import dumps as json_dumps
+from statistics import mean, median
+from time import perf_counter, thread_time
+from typing import Any, Dict, List, Optional
+
+from djgaro.utils.extraction import (
+    EXTRACTION_PROFILES,
+    create_info_extractor,
+    extract_stream_info,
+    extraction_options,
+)
+
+
+VIDEO_ID = "benchVideo1"
+
+# itag, ext, acodec, vcodec, height, abr/tbr(kbit/s)
+AUDIO_FORMATS = [
+    ("249", "webm", "opus", "none", None, 50.0),
+    ("250", "webm", "opus", "none", None, 70.0),
+    ("139", "m4a", "mp4a.40.5", "none", None, 48.0),
+    ("140", "m4a", "mp4a.40.2", "none", None, 129.0),
+    ("251", "webm", "opus", "none", None, 160.0),
+]
+VIDEO_FORMATS = [
+    (itag, ext, "none", vcodec, height, tbr)
+    for itag, ext, vcodec, height, tbr in [
+        ("160", "mp4", "avc1.4d400c", 144, 100.0),
+        ("278", "webm", "vp9", 144, 95.0),
+        ("394", "mp4", "av01.0.00M.08", 144, 80.0),
+        ("133", "mp4", "avc1.4d4015", 240, 250.0),
+        ("242", "webm", "vp9", 240, 220.0),
+        ("395", "mp4", "av01.0.00M.08", 240, 200.0),
+        ("134", "mp4", "avc1.4d401e", 360, 600.0),
+        ("243", "webm", "vp9", 360, 400.0),
+        ("396", "mp4", "av01.0.01M.08", 360, 350.0),
+        ("135", "mp4", "avc1.4d401f", 480, 1100.0),
+        ("244", "webm", "vp9", 480, 750.0),
+        ("397", "mp4", "av01.0.04M.08", 480, 650.0),
+        ("136", "mp4", "avc1.4d401f", 720, 2200.0),
+        ("247", "webm", "vp9", 720, 1500.0),
+        ("398", "mp4", "av01.0.05M.08", 720, 1300.0),
+        ("137", "mp4", "avc1.640028", 1080, 4300.0),
+        ("248", "webm", "vp9", 1080, 2700.0),
+        ("399", "mp4", "av01.0.08M.08", 1080, 2300.0),
+    ]
+]
+HLS_HEIGHTS = [144, 240, 360, 480, 720, 1080]
+
+
+def synthetic_info(include_hls: bool) -> Dict[str, Any]:
+    """An info dict shaped like the one yt_dlp's youtube extractor returns for a music video"""
+
+    formats = []
+    for itag, ext, acodec, vcodec, height, bitrate in AUDIO_FORMATS + VIDEO_FORMATS:
+        formats.append(
+            {
+                "format_id": itag,
+                "url": f"https://bench.googlevideo.invalid/videoplayback?itag={itag}&expire=9999999999",
+                "ext": ext,
+                "acodec": acodec,
+                "vcodec": vcodec,
+                "height": height,
+                "width": height and height * 16 // 9,
+                "abr" if vcodec == "none" else "tbr": bitrate,
+                "asr": 48000 if acodec != "none" else None,
+                "audio_channels": 2 if acodec != "none" else None,
+                "filesize": int(bitrate * 1000 / 8 * 213),
+                "protocol": "https",
+                "format_note": f"{height}p" if height else "medium",
+                "http_headers": {"User-Agent": "bench"},
+            }
+        )
+    if include_hls:
+        for height in HLS_HEIGHTS:
+            formats.append(
+                {
+                    "format_id": f"hls-{height}",
+                    "url": f"https://bench.manifest.invalid/{height}/index.m3u8",
+                    "ext": "mp4",
+                    "acodec": "mp4a.40.2",
+                    "vcodec": "avc1.4d401f",
+                    "height": height,
+                    "width": height * 16 // 9,
+                    "tbr": height * 2.5,
+                    "protocol": "m3u8_native",
+                }
+            )
+
+    return {
+        "id": VIDEO_ID,
+        "title": "Benchmark track",
+        "duration": 213,
+        "formats": formats,
+        "thumbnails": [
+            {"url": f"https://bench.ytimg.invalid/{size}.jpg", "preference": index}
+            for index, size in enumerate(
+                ["default", "mqdefault", "hqdefault", "maxres"]
+            )
+        ],
+        "webpage_url": f"https://www.youtube.com/watch?v={VIDEO_ID}",
+    }
+
+
+def patch_extractor(info_extractor: Any) -> None:
+    """Replaces the network part of the youtube extractor with the synthetic response"""
+
+    youtube = info_extractor.get_info_extractor("Youtube")
+
+    def real_extract(url: str) -> Dict[str, Any]:
+        skipped = youtube._configuration_arg("skip")
+        return synthetic_info(include_hls="hls" not in skipped)
+
+    youtube._real_extract = real_extract
+
+
+def measure_profile(
+    profile: str, urls: List[str], calls: int, warm_up: int, offline: bool
+) -> Dict[str, Any]:
+    dlp_options, ie_key = extraction_options(profile)
+    # The benchmark's output shouldn't drown in yt_dlp's
+    info_extractor = create_info_extractor(
+        {**dlp_options, "quiet": True, "no_warnings": True}
+    )
+    if offline:
+        patch_extractor(info_extractor)
+
+    latencies, cpu_times, stream = [], [], None
+    for call in range(warm_up + calls):
+        url = urls[call % len(urls)]
+        started, cpu_started = perf_counter(), thread_time()
+        stream = extract_stream_info(info_extractor, url, ie_key=ie_key)
+        if call >= warm_up:
+            latencies.append(perf_counter() - started)
+            cpu_times.append(thread_time() - cpu_started)
+
+    latencies.sort()
+    return {
+        "profile": profile,
+        "calls": calls,
+        "latency_p50": median(latencies),
+        "latency_p95": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+        "latency_mean": mean(latencies),
+        "cpu_mean": mean(cpu_times),
+        "stream_acodec": stream.acodec if stream else "",
+        "stream_abr": stream.abr if stream else 0.0,
+        "resolved": bool(stream and stream.url),
+    }
+
+
+def print_results(results: List[Dict[str, Any]], offline: bool) -> None:
+    print(
+        f"{'synthetic' if offline else 'network'} extraction, "
+        f"{results[0]['calls']} calls per profile"
+    )
+    print(
+        f"{'profile':>10} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'cpu ms':>9}  stream"
+    )
+    for result in results:
+        stream = (
+            f"{result['stream_acodec']} {result['stream_abr']:g}kbps"
+            if result["resolved"]
+            else "not resolved"
+        )
+        print(
+            f"{result['profile']:>10} {result['latency_p50'] * 1000:9.2f} "
+            f"{result['latency_p95'] * 1000:9.2f} {result['latency_mean'] * 1000:9.2f} "
+            f"{result['cpu_mean'] * 1000:9.2f}  {stream}"
+        )
+
+    baseline = next((r for r in results if r["profile"] == "default"), None)
+    if baseline:
+        for result in results:
+            if result is baseline or not result["latency_mean"]:
+                continue
+            print(
+                f"{result['profile']}: {baseline['latency_mean'] / result['latency_mean']:.2f}x faster, "
+                f"{baseline['cpu_mean'] / max(result['cpu_mean'], 1e-9):.2f}x less CPU than default"
+            )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--profiles",
+        default=",".join(EXTRACTION_PROFILES),
+        help="comma separated extraction profiles to compare",
+    )
+    parser.add_argument(
+        "--calls", type=int, default=100, help="measured calls per profile"
+    )
+    parser.add_argument(
+        "--warm-up", type=int, default=3, help="unmeasured calls before measuring"
+    )
+    parser.add_argument(
+        "--url",
+        action="append",
+        default=[],
+        help="real youtube video URL to extract(needs network access), can be repeated",
+    )
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    offline = not args.url
+    urls = args.url or [f"https://www.youtube.com/watch?v={VIDEO_ID}"]
+    results = [
+        measure_profile(profile.strip(), urls, args.calls, args.warm_up, offline)
+        for profile in args.profiles.split(",")
+        if profile.strip()
+    ]
+    if args.json:
+        print(json_dumps(results, indent=2))
+    else:
+        print_results(results, offline)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
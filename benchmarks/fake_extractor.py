@@ -0,0 +1,42 @@
+"""Extraction backend which resolves stream URLs without yt_dlp or network access"""
+
+from asyncio import sleep
+import random
+from time import time
+from typing import Optional, Set
+
+from djgaro.utils.extraction import Extractor, StreamInfo
+
+
+class FakeExtractor(Extractor):
+    """Returns an opus StreamInfo after `latency` seconds, fails for `failing_ids` and a `failure_rate` share of calls"""
+
+    def __init__(
+        self,
+        latency: float = 0.3,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        failing_ids: Optional[Set[str]] = None,
+        url_ttl: float = 6 * 60 * 60,
+    ) -> None:
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failing_ids = failing_ids or set()
+        self.url_ttl = url_ttl
+        self.calls = 0
+
+    async def _extract(self, video_url: str) -> StreamInfo:
+        self.calls += 1
+        await sleep(self.latency + random.uniform(0, self.jitter))
+
+        video_id = video_url.rsplit("=", 1)[-1]
+        if video_id in self.failing_ids or random.random() < self.failure_rate:
+            return StreamInfo()
+        expire = int(time() + self.url_ttl)
+        return StreamInfo(
+            f"https://bench.googlevideo.invalid/videoplayback?id={video_id}&expire={expire}",
+            "opus",
+            128.0,
+        )
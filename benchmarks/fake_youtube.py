@@ -0,0 +1,126 @@
+"""Local stand-in for the parts of the YouTube Data API the bot uses(search, playlistItems, videos)"""
+
+from asyncio import sleep
+from collections import Counter
+import random
+from typing import Optional
+from aiohttp import web
+
+import djgaro.cogs.music as music
+
+
+class FakeYouTubeAPI(object):
+    """Serves deterministic search, playlistItems and videos responses with configurable latency.
+
+    Playlist IDs of the form 'bench-<count>' contain <count> videos, any other playlist ID
+    contains `default_playlist_size` videos. Search queries return a single video, unless
+    the query starts with 'playlist ' in which case the rest of the query is used as the
+    playlist ID of the result.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        page_size: int = 50,
+        default_playlist_size: int = 50,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.default_playlist_size = default_playlist_size
+        self.host = host
+        self.port = port
+        self.requests = Counter()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/youtube/v3/"
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/youtube/v3/search", self._search)
+        app.router.add_get("/youtube/v3/playlistItems", self._playlist_items)
+        app.router.add_get("/youtube/v3/videos", self._videos)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def install(self) -> None:
+        """Points the music cog's API URLs at this server"""
+
+        music.YT_API_VIDEO_BASE_URL = self.base_url + "search?"
+        music.YT_API_PLAYLISTITEMS_BASE_URL = self.base_url + "playlistItems?"
+        music.YT_API_VIDEODATA_URL = self.base_url + "videos?"
+
+    async def _respond(self, endpoint: str) -> None:
+        self.requests[endpoint] += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            await sleep(delay)
+
+    def _playlist_size(self, playlist_id: str) -> int:
+        if playlist_id.startswith("bench-"):
+            return int(playlist_id.split("-", 1)[1])
+        return self.default_playlist_size
+
+    async def _search(self, request: web.Request) -> web.Response:
+        await self._respond("search")
+        query = request.query.get("q", "")
+        if query.startswith("playlist "):
+            item_id = {"kind": "youtube#playlist", "playlistId": query.split(" ", 1)[1]}
+        else:
+            item_id = {
+                "kind": "youtube#video",
+                "videoId": f"search{abs(hash(query)) % 10**8}",
+            }
+        return web.json_response({"items": [{"id": item_id, "snippet": {}}]})
+
+    async def _playlist_items(self, request: web.Request) -> web.Response:
+        await self._respond("playlistItems")
+        playlist_id = request.query["playlistId"]
+        page_size = min(int(request.query.get("maxResults", 5)), self.page_size)
+        start = int(request.query.get("pageToken", "0"))
+        end = min(start + page_size, self._playlist_size(playlist_id))
+
+        response = {
+            "items": [
+                {"snippet": {"resourceId": {"videoId": f"{playlist_id}.{index}"}}}
+                for index in range(start, end)
+            ]
+        }
+        if end < self._playlist_size(playlist_id):
+            response["nextPageToken"] = str(end)
+        return web.json_response(response)
+
+    async def _videos(self, request: web.Request) -> web.Response:
+        await self._respond("videos")
+        video_ids = [
+            video_id for video_id in request.query["id"].split(",") if video_id
+        ]
+        if len(video_ids) > 50:
+            return web.json_response({"error": "too many ids"}, status=400)
+
+        return web.json_response(
+            {
+                "items": [
+                    {
+                        "id": video_id,
+                        "snippet": {"title": f"Benchmark track {video_id}"},
+                        "contentDetails": {"duration": "PT3M25S"},
+                    }
+                    for video_id in video_ids
+                ]
+            }
+        )
@@ -0,0 +1,242 @@
+"""Minimal stand-ins for the discord objects MusicCog touches, so commands can run without discord"""
+
+from itertools import count
+import os
+import threading
+from time import monotonic
+from typing import Callable, List, Optional, Tuple
+
+import djgaro.cogs.music as music
+from djgaro.cogs.music import MusicCog
+
+
+_guild_ids = count(1)
+_channel_ids = count(1)
+
+
+class FakeAudioSource(object):
+    """Replaces GovernedOpusAudio, no ffmpeg process is started"""
+
+    created = 0
+    probed = 0
+
+    def __init__(self, source: str, **kwargs) -> None:
+        FakeAudioSource.created += 1
+        self.source = source
+        self.kwargs = kwargs
+
+    @classmethod
+    async def probe(cls, source: str, **kwargs) -> Tuple[Optional[str], Optional[int]]:
+        cls.probed += 1
+        return "opus", None
+
+    def is_opus(self) -> bool:
+        return True
+
+    def read(self) -> bytes:
+        return b""
+
+    def cleanup(self) -> None:
+        pass
+
+
+class FakeVoiceChannel(object):
+    def __init__(self, guild: "FakeGuild", name: str = "bench-voice") -> None:
+        self.id = next(_channel_ids)
+        self.guild = guild
+        self.name = name
+        self.members: List[object] = []
+        self.bitrate = 64000
+
+    async def connect(self, **kwargs) -> "FakeVoiceClient":
+        voice_client = FakeVoiceClient(self)
+        self.guild.voice_client = voice_client
+        return voice_client
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeVoiceClient(object):
+    """Pretends to stream audio, a track 'ends' after `track_seconds`(never if it's None).
+
+    Like discord's VoiceClient, the `after` callback runs on another thread, both when a
+    track ends and when it's stopped.
+    """
+
+    def __init__(
+        self, channel: FakeVoiceChannel, track_seconds: Optional[float] = None
+    ) -> None:
+        self.channel = channel
+        self.guild = channel.guild
+        self.track_seconds = track_seconds
+        self.source: Optional[FakeAudioSource] = None
+        self.played: List[str] = []
+        self.play_times: List[float] = []
+        self._after: Optional[Callable] = None
+        self._timer: Optional[threading.Timer] = None
+        self._paused = False
+
+    def is_connected(self) -> bool:
+        return True
+
+    def is_playing(self) -> bool:
+        return self.source is not None and not self._paused
+
+    def is_paused(self) -> bool:
+        return self.source is not None and self._paused
+
+    def play(
+        self, source: FakeAudioSource, *, after: Optional[Callable] = None, **kwargs
+    ) -> None:
+        if self.source is not None:
+            raise RuntimeError("Already playing audio.")
+        self.source, self._after, self._paused = source, after, False
+        self.played.append(source.source)
+        self.play_times.append(monotonic())
+        track_seconds = (
+            self.guild.track_seconds
+            if self.track_seconds is None
+            else self.track_seconds
+        )
+        if track_seconds is not None:
+            self._timer = threading.Timer(track_seconds, self._finish)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def pause(self) -> None:
+        self._paused = True
+
+    def resume(self) -> None:
+        self._paused = False
+
+    def stop(self) -> None:
+        self._finish()
+
+    async def disconnect(self, *, force: bool = False) -> None:
+        self.stop()
+        self.guild.voice_client = None
+
+    def _finish(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        after, self._after = self._after, None
+        if self.source is None:
+            return None
+        self.source.cleanup()
+        self.source = None
+        if after is not None:
+            threading.Thread(target=after, args=(None,), daemon=True).start()
+
+
+class FakeGuild(object):
+    def __init__(
+        self, guild_id: Optional[int] = None, track_seconds: Optional[float] = None
+    ) -> None:
+        self.id = guild_id if guild_id is not None else next(_guild_ids)
+        self.name = f"bench-guild-{self.id}"
+        self.track_seconds = track_seconds
+        self.voice_client: Optional[FakeVoiceClient] = None
+        self.voice_channel = FakeVoiceChannel(self)
+        self.text_channel = FakeTextChannel()
+
+    def get_channel(self, channel_id: int) -> Optional[object]:
+        for channel in (self.voice_channel, self.text_channel):
+            if channel.id == channel_id:
+                return channel
+        return None
+
+
+class FakeAuthor(object):
+    def __init__(self, guild: FakeGuild) -> None:
+        self.name = self.display_name = "bench-user"
+        self.bot = False
+        self.voice = type("FakeVoiceState", (), {"channel": guild.voice_channel})()
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class _Typing(object):
+    async def __aenter__(self) -> "_Typing":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+
+class FakeTextChannel(object):
+    def __init__(self) -> None:
+        self.id = next(_channel_ids)
+        self.messages: List[tuple] = []
+
+    async def send(self, *args, **kwargs) -> None:
+        self.messages.append((args, kwargs))
+
+    def typing(self) -> _Typing:
+        return _Typing()
+
+
+class FakeContext(object):
+    """Only what MusicCog's commands use: guild, author, voice_client, channel, send and reply"""
+
+    def __init__(self, guild: FakeGuild) -> None:
+        self.guild = guild
+        self.author = FakeAuthor(guild)
+        self.channel = guild.text_channel
+        self.messages: List[tuple] = []
+
+    @property
+    def voice_client(self) -> Optional[FakeVoiceClient]:
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs) -> None:
+        self.messages.append((args, kwargs))
+
+    async def reply(self, *args, **kwargs) -> None:
+        self.messages.append((args, kwargs))
+
+
+class FakeBot(object):
+    def __init__(self) -> None:
+        self.guilds: List[FakeGuild] = []
+        self.user = None
+        self.extensions = {"djgaro.cogs.music": music}
+
+    @property
+    def voice_clients(self) -> List[FakeVoiceClient]:
+        return [guild.voice_client for guild in self.guilds if guild.voice_client]
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+    async def wait_until_ready(self) -> None:
+        pass
+
+
+async def create_cog(
+    bot: FakeBot, extractor=None, metadata_cache: bool = False
+) -> MusicCog:
+    """Creates and loads a MusicCog which plays FakeAudioSources and uses the given extractor"""
+
+    os.environ.setdefault("YT_API_KEY", "benchmark")
+    os.environ.setdefault("DJGARO_SNAPSHOT", "false")
+    if not metadata_cache:
+        os.environ["DJGARO_METADATA_CACHE_SIZE"] = "0"
+    music.GovernedOpusAudio = FakeAudioSource
+
+    cog = MusicCog(bot)
+    if extractor is not None:
+        cog._extractor = extractor
+    await cog.cog_load()
+    return cog
+
+
+async def invoke(
+    cog: MusicCog, command_name: str, ctx: FakeContext, *args, **kwargs
+) -> None:
+    """Runs a command's callback directly, skipping discord's argument parsing and checks"""
+
+    command = next(c for c in cog.get_commands() if c.name == command_name)
+    await command.callback(cog, ctx, *args, **kwargs)
@@ -0,0 +1,162 @@
+"""Offline benchmark of the resolver pipeline: search/playlist/metadata ingestion and stream extraction.
+
+Runs the real MusicCog against a local fake YouTube API and a fake extractor, no network
+access or discord connection is needed. Run from the repository root:
+
+    python -m benchmarks.resolver --sizes 10,100,1000,5000 --api-latency 0.05 --extract-latency 0.3
+"""
+
+from argparse import ArgumentParser
+from asyncio import run
+from json import dumps as json_dumps
+import gc
+from statistics import median
+from time import monotonic
+import tracemalloc
+from typing import Dict, List
+
+from benchmarks.fake_extractor import FakeExtractor
+from benchmarks.fake_youtube import FakeYouTubeAPI
+from benchmarks.harness import FakeBot, FakeContext, FakeGuild, create_cog, invoke
+
+
+async def measure_playlist(
+    api: FakeYouTubeAPI, size: int, extract_latency: float, trace_memory: bool
+) -> Dict[str, float]:
+    """Plays a 'bench-<size>' playlist in a fresh guild, returns its timings(and memory)"""
+
+    bot = FakeBot()
+    guild = FakeGuild()
+    bot.guilds.append(guild)
+    cog = await create_cog(bot, extractor=FakeExtractor(latency=extract_latency))
+    ctx = FakeContext(guild)
+    api.requests.clear()
+
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+
+    started = monotonic()
+    await invoke(
+        cog, "play", ctx, query=f"https://www.youtube.com/playlist?list=bench-{size}"
+    )
+    first_audio = (
+        guild.voice_client.play_times[0] - started
+        if guild.voice_client.play_times
+        else float("nan")
+    )
+
+    player = cog.players.get(guild.id)
+    await player.wait_for_items(size)
+    ingested = monotonic() - started
+
+    result = {
+        "tracks": len(player.playlist),
+        "time_to_first_audio": first_audio,
+        "ingestion_time": ingested,
+        "tracks_per_second": len(player.playlist) / ingested if ingested else 0.0,
+        "api_requests": sum(api.requests.values()),
+    }
+    if trace_memory:
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["retained_bytes_per_track"] = (current - baseline) / max(
+            len(player.playlist), 1
+        )
+        result["peak_bytes"] = peak - baseline
+
+    await invoke(cog, "leave", ctx)
+    await cog.cog_unload()
+    return result
+
+
+async def run_benchmarks(args) -> List[Dict[str, float]]:
+    api = FakeYouTubeAPI(latency=args.api_latency, jitter=args.api_jitter)
+    await api.start()
+    api.install()
+
+    results = []
+    try:
+        for size in args.sizes:
+            runs = [
+                await measure_playlist(
+                    api, size, args.extract_latency, trace_memory=False
+                )
+                for _ in range(args.repeat)
+            ]
+            memory = await measure_playlist(
+                api, size, args.extract_latency, trace_memory=True
+            )
+            results.append(
+                {
+                    "size": size,
+                    "tracks": runs[0]["tracks"],
+                    "time_to_first_audio": median(
+                        r["time_to_first_audio"] for r in runs
+                    ),
+                    "ingestion_time": median(r["ingestion_time"] for r in runs),
+                    "tracks_per_second": median(r["tracks_per_second"] for r in runs),
+                    "api_requests": runs[0]["api_requests"],
+                    "retained_bytes_per_track": memory["retained_bytes_per_track"],
+                    "peak_bytes": memory["peak_bytes"],
+                }
+            )
+    finally:
+        await api.stop()
+    return results
+
+
+def print_table(results: List[Dict[str, float]]) -> None:
+    print(
+        f"{'tracks':>7} {'first audio':>12} {'ingestion':>10} {'tracks/s':>9} "
+        f"{'requests':>9} {'B/track':>8} {'peak KiB':>9}"
+    )
+    for r in results:
+        print(
+            f"{r['tracks']:>7} {r['time_to_first_audio'] * 1000:>10.1f}ms {r['ingestion_time'] * 1000:>8.1f}ms "
+            f"{r['tracks_per_second']:>9.0f} {r['api_requests']:>9} {r['retained_bytes_per_track']:>8.0f} "
+            f"{r['peak_bytes'] / 1024:>9.0f}"
+        )
+
+
+def main() -> int:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[10, 100, 1000, 5000],
+        help="comma separated playlist sizes",
+    )
+    parser.add_argument(
+        "--api-latency", type=float, default=0.05, help="seconds per fake API request"
+    )
+    parser.add_argument(
+        "--api-jitter",
+        type=float,
+        default=0.0,
+        help="random extra seconds per API request",
+    )
+    parser.add_argument(
+        "--extract-latency", type=float, default=0.3, help="seconds per fake extraction"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="timed runs per size, the median is reported",
+    )
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = run(run_benchmarks(args))
+    if args.json:
+        print(json_dumps(results, indent=2))
+    else:
+        print_table(results)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
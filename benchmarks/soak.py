@@ -0,0 +1,306 @@
+"""Multi-guild soak/load test of MusicCog with simulated voice clients.
+
+Drives play, next, previous, rewind and listsongs across many simulated guilds against the
+local fake YouTube API and a fake extractor, and periodically reports commands per second,
+event loop lag, the memory held by every guild's player, the average RSS growth per guild and
+task/thread counts. Run from the repository root:
+
+    python -m benchmarks.soak --guilds 200 --duration 300 --track-seconds 10
+"""
+
+from argparse import ArgumentParser
+from asyncio import all_tasks, current_task, gather, get_running_loop, run, sleep
+from collections import Counter
+from enum import Enum
+import gc
+from json import dumps as json_dumps
+import os
+import random
+import sys
+import threading
+from time import monotonic
+import tracemalloc
+from typing import Dict, List, Set
+
+from benchmarks.fake_extractor import FakeExtractor
+from benchmarks.fake_youtube import FakeYouTubeAPI
+from benchmarks.harness import FakeBot, FakeContext, FakeGuild, create_cog, invoke
+from djgaro.utils.stats import LatencyHistogram
+
+
+COMMAND_WEIGHTS = {
+    "next": 5,
+    "listsongs": 3,
+    "previous": 2,
+    "rewind": 1,
+    "play": 1,
+}
+
+
+def memory_bytes() -> int:
+    """Resident memory of the process, traced python memory where /proc isn't available"""
+
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+def player_bytes(player) -> int:
+    """Memory held by a guild's player: its queue, songs, skip links and prefetcher.
+
+    Only the player's own objects are counted: containers and instances of djgaro's classes are
+    followed, the voice client, tasks, locks and everything shared between guilds aren't.
+    """
+
+    seen: Set[int] = set()
+    pending = [player]
+    total = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, (dict, list, tuple, set)) or (
+            type(obj).__module__.startswith("djgaro.")
+            and not isinstance(obj, (type, Enum))
+        ):
+            pending.extend(
+                referent
+                for referent in gc.get_referents(obj)
+                if isinstance(referent, (dict, list, tuple, set, str, int, float))
+                or (
+                    type(referent).__module__.startswith("djgaro.")
+                    and not isinstance(referent, (type, Enum))
+                )
+            )
+    return total
+
+
+class SoakStats(object):
+    def __init__(self) -> None:
+        self.commands = Counter()
+        self.errors = Counter()
+        self.command_latency: Dict[str, LatencyHistogram] = {}
+        self.loop_lag = LatencyHistogram()
+        self.samples: List[Dict[str, float]] = []
+
+    def observe_command(self, name: str, seconds: float) -> None:
+        self.commands[name] += 1
+        self.command_latency.setdefault(name, LatencyHistogram()).observe(seconds)
+
+
+async def guild_session(
+    cog, ctx: FakeContext, query: str, deadline: float, think: float, stats: SoakStats
+) -> None:
+    rng = random.Random(ctx.guild.id)
+    names, weights = zip(*COMMAND_WEIGHTS.items())
+
+    name, kwargs = "play", {"query": query}
+    while monotonic() < deadline:
+        started = monotonic()
+        try:
+            await invoke(cog, name, ctx, **kwargs)
+        except Exception as exc:
+            stats.errors[f"{name}: {type(exc).__name__}"] += 1
+        stats.observe_command(name, monotonic() - started)
+
+        await sleep(rng.expovariate(1 / think) if think > 0 else 0)
+        name = rng.choices(names, weights)[0]
+        kwargs = {"query": query} if name == "play" else {}
+
+
+async def sample_loop_lag(
+    stats: SoakStats, deadline: float, interval: float = 0.1
+) -> None:
+    loop = get_running_loop()
+    while monotonic() < deadline:
+        expected = loop.time() + interval
+        await sleep(interval)
+        stats.loop_lag.observe(max(loop.time() - expected, 0.0))
+
+
+async def report(
+    cog,
+    stats: SoakStats,
+    guilds: int,
+    baseline_memory: int,
+    deadline: float,
+    interval: float,
+    quiet: bool,
+) -> None:
+    started = last_time = monotonic()
+    last_commands = 0
+    while monotonic() < deadline:
+        await sleep(min(interval, max(deadline - monotonic(), 0.01)))
+        now, commands = monotonic(), sum(stats.commands.values())
+        players = [player_bytes(player) for player in cog.players] or [0]
+        sample = {
+            "elapsed": now - started,
+            "commands_per_second": (commands - last_commands) / (now - last_time),
+            "loop_lag_p99": stats.loop_lag.percentile(0.99),
+            "loop_lag_max": stats.loop_lag.max,
+            "player_bytes_avg": sum(players) / len(players),
+            "player_bytes_max": max(players),
+            # What the whole process grew by since before the guilds were created, spread evenly:
+            # includes caches, fragmentation and anything else that doesn't scale with the guilds
+            "rss_growth_per_guild": max(memory_bytes() - baseline_memory, 0) / guilds,
+            "tasks": len(all_tasks()),
+            "threads": threading.active_count(),
+        }
+        stats.samples.append(sample)
+        last_commands, last_time = commands, now
+        if not quiet:
+            print(
+                f"[{sample['elapsed']:6.1f}s] {sample['commands_per_second']:8.1f} cmd/s | "
+                f"loop lag p99 {sample['loop_lag_p99'] * 1000:6.1f}ms max {sample['loop_lag_max'] * 1000:6.1f}ms | "
+                f"player {sample['player_bytes_avg'] / 1024:6.1f} KiB avg {sample['player_bytes_max'] / 1024:6.1f} KiB max | "
+                f"RSS +{sample['rss_growth_per_guild'] / 1024:7.1f} KiB/guild | {sample['tasks']:5} tasks | "
+                f"{sample['threads']:4} threads"
+            )
+
+
+async def soak(args) -> Dict[str, object]:
+    api = FakeYouTubeAPI(latency=args.api_latency, jitter=args.api_latency / 2)
+    await api.start()
+    api.install()
+
+    bot = FakeBot()
+    extractor = FakeExtractor(
+        latency=args.extract_latency,
+        jitter=args.extract_latency / 2,
+        failure_rate=args.failure_rate,
+    )
+    cog = await create_cog(bot, extractor=extractor)
+    # The interpreter, the imported modules and the cog itself aren't a cost of the guilds
+    baseline_memory = memory_bytes()
+    guilds = [FakeGuild(track_seconds=args.track_seconds) for _ in range(args.guilds)]
+    bot.guilds.extend(guilds)
+    contexts = [FakeContext(guild) for guild in guilds]
+
+    stats = SoakStats()
+    deadline = monotonic() + args.duration
+    query = f"https://www.youtube.com/playlist?list=bench-{args.playlist_size}"
+    await gather(
+        sample_loop_lag(stats, deadline),
+        report(
+            cog,
+            stats,
+            args.guilds,
+            baseline_memory,
+            deadline,
+            args.report_interval,
+            args.json,
+        ),
+        *(
+            guild_session(cog, ctx, query, deadline, args.think, stats)
+            for ctx in contexts
+        ),
+    )
+
+    for ctx in contexts:
+        await invoke(cog, "leave", ctx)
+    await cog.cog_unload()
+    await api.stop()
+    # Whatever is still alive after every guild left and the cog was unloaded has leaked
+    await sleep(max(args.track_seconds or 0, 1.0))
+    leaked_tasks = sorted(
+        repr(task.get_coro()) for task in all_tasks() if task is not current_task()
+    )
+
+    return {
+        "guilds": args.guilds,
+        "duration": args.duration,
+        "commands": dict(stats.commands),
+        "errors": dict(stats.errors),
+        "commands_per_second": sum(stats.commands.values()) / args.duration,
+        "command_latency_p99": {
+            name: h.percentile(0.99) for name, h in stats.command_latency.items()
+        },
+        "loop_lag_p50": stats.loop_lag.percentile(0.50),
+        "loop_lag_p99": stats.loop_lag.percentile(0.99),
+        "loop_lag_max": stats.loop_lag.max,
+        "extractions": extractor.calls,
+        "api_requests": dict(api.requests),
+        "leaked_tasks": leaked_tasks,
+        "samples": stats.samples,
+    }
+
+
+def print_summary(result: Dict[str, object]) -> None:
+    print()
+    print(
+        f"guilds: {result['guilds']}, duration: {result['duration']}s, {result['commands_per_second']:.1f} cmd/s"
+    )
+    for name, count in sorted(result["commands"].items()):
+        print(
+            f"  {name:10} {count:8} commands, p99 {result['command_latency_p99'][name] * 1000:8.1f}ms"
+        )
+    for error, count in sorted(result["errors"].items()):
+        print(f"  error {error}: {count}")
+    print(
+        f"event loop lag p50 {result['loop_lag_p50'] * 1000:.1f}ms, p99 {result['loop_lag_p99'] * 1000:.1f}ms, "
+        f"max {result['loop_lag_max'] * 1000:.1f}ms"
+    )
+    print(
+        f"extractions: {result['extractions']}, api requests: {result['api_requests']}"
+    )
+    print(f"tasks left after unload: {len(result['leaked_tasks'])}")
+    for task in result["leaked_tasks"]:
+        print(f"  {task}")
+
+
+def main() -> int:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--guilds", type=int, default=50, help="number of simulated guilds"
+    )
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run")
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=1.0,
+        help="mean seconds between commands of a guild",
+    )
+    parser.add_argument(
+        "--track-seconds",
+        type=float,
+        default=5.0,
+        help="simulated track length, 0 never ends",
+    )
+    parser.add_argument(
+        "--playlist-size", type=int, default=200, help="songs in every guild's playlist"
+    )
+    parser.add_argument(
+        "--api-latency", type=float, default=0.05, help="seconds per fake API request"
+    )
+    parser.add_argument(
+        "--extract-latency", type=float, default=0.3, help="seconds per fake extraction"
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.02, help="share of failing extractions"
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=5.0,
+        help="seconds between progress reports",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print only the final result, as JSON"
+    )
+    args = parser.parse_args()
+    args.track_seconds = args.track_seconds or None
+
+    result = run(soak(args))
+    if args.json:
+        print(json_dumps(result, indent=2))
+    else:
+        print_summary(result)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,52 +1,80 @@
-from enum import Enum
-from typing import Any, Dict, Optional, List
-from aiohttp import request
-from attr import dataclass
-from discord import Embed, FFmpegOpusAudio, Member, VoiceState
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, List, Tuple
+from aiohttp import ClientSession
+from discord import (
+    AudioSource,
+    Embed,
+    Guild,
+    Member,
+    VoiceClient,
+    VoiceState,
+)
+from discord.abc import Messageable
 from discord.colour import Colour
-from discord.ext.commands import Cog, Bot, command, Context
-from discord.utils import get
-from asyncio import to_thread as async_to_thread
+from discord.ext.commands import Cog, Bot, command, Context, has_guild_permissions
+from asyncio import Semaphore, Task, create_task, sleep, to_thread
+from collections import deque
 import os
+import re
 from urllib import parse
 from validators import url as is_url
-from isoduration import parse_duration
 from logging import getLogger
+from time import monotonic
 
-from yt_dlp import YoutubeDL
 from djgaro.utils.constants import (
     YT_API_PLAYLISTITEMS_BASE_URL,
     YT_API_VIDEODATA_URL,
+    YT_API_VIDEODATA_MAX_IDS,
     YT_API_PLAYLISTITEMS_MAX_RESULTS,
     YT_API_VIDEO_BASE_URL,
-    YT_WEB_VIDEO_BASE_URL,
+    STREAM_URL_CACHE_SIZE,
+    METADATA_FETCH_CONCURRENCY,
+    PLAYLIST_MAX_ITEMS,
+    PREFETCH_WINDOW,
+    EXTRACTION_CONCURRENCY,
+    PASSTHROUGH_ACODECS,
+    LOOP_STALL_THRESHOLD,
+    METADATA_BATCH_WINDOW,
+    PRELOAD_SECONDS,
+    IDLE_DISCONNECT_DELAY,
+    SNAPSHOT_MAX_AGE,
+)
+from djgaro.utils.audio_cache import CachingOpusAudio, create_audio_cache
+from djgaro.utils.batching import MicroBatcher
+from djgaro.utils.config import env_float, env_int
+from djgaro.utils.extraction import StreamInfo, create_extractor
+from djgaro.utils.ffmpeg import (
+    GovernedOpusAudio,
+    channel_bitrate,
+    create_ffmpeg_governor,
+    degraded_options,
+)
+from djgaro.utils.http import create_http_session
+from djgaro.utils.metadata_cache import create_metadata_cache
+from djgaro.utils.metrics import Metric
+from djgaro.utils.player import GuildPlayer, LoopMode, PlayerRegistry, PlaylistItem
+from djgaro.utils.prefetch import Prefetcher
+from djgaro.utils.single_flight import SingleFlight
+from djgaro.utils.snapshot import (
+    PlayerSnapshot,
+    load_snapshot,
+    save_snapshot,
+    snapshot_path,
+    snapshot_player,
 )
+from djgaro.utils.song_queue import SongQueue, format_duration
+from djgaro.utils.stats import PLAY_STATS, LoopWatchdog
+from djgaro.utils.url_cache import StreamUrlCache
 
 
 LOGGER = getLogger("dj_garo")
 
-
-class LoopMode(Enum):
-    NO_REPEAT = 1
-    REPEAT_ONE = 2
-    REPEAT_ALL = 3
-
-
-@dataclass
-class PlaylistItem(object):
-    video_id: str = ""
-    yt_url: str = ""
-    raw_url: str = ""
-    title: str = ""
-    duration: str = ""
-
-    def __str__(self) -> str:
-        return f"{self.title} - [{self.duration}] - {self.yt_url}"
+YT_DURATION_PATTERN = re.compile(
+    r"P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?)?"
+)
 
 
 class MusicCog(Cog):
 
-    ACODECS = ["opus"]
     ITEM_LISTING_COUNT = 5
     loop_modes = {
         "all": LoopMode.REPEAT_ALL,
@@ -56,31 +84,373 @@ class MusicCog(Cog):
 
     def __init__(self, bot: Bot) -> None:
         self._bot = bot
-        self._dlp = YoutubeDL()
-        self.stopped = False
-        self.dlp_options = {}
-        self.song_idx = 0
-        self.playlist: List[PlaylistItem] = []
-        self.voice_client = None
-        self.repeat_mode = LoopMode.REPEAT_ALL
+        self._extractor = create_extractor()
+        self.players = PlayerRegistry(self._create_player)
+        self._url_cache = StreamUrlCache(
+            max_entries=env_int("DJGARO_URL_CACHE_SIZE", STREAM_URL_CACHE_SIZE)
+        )
+        self._url_refresh_tasks: Dict[str, Task] = {}
+        # Pending disconnects from voice channels the bot was left alone in, by guild id
+        self._idle_disconnects: Dict[int, Task] = {}
+        self._idle_disconnect_delay = env_float(
+            "DJGARO_IDLE_DISCONNECT_DELAY", IDLE_DISCONNECT_DELAY
+        )
+        self._warm_up_task: Optional[Task] = None
+        self._restore_task: Optional[Task] = None
+        # Set by garo-start when the shards run in several worker processes
+        self._worker_index = getattr(bot, "worker_index", None)
+        self._snapshot_path = snapshot_path(self._worker_index)
+        # Concurrent lookups of the same video, playlist page or search are done only once
+        self._extractions: SingleFlight[str, StreamInfo] = SingleFlight()
+        self._video_lookups: SingleFlight[str, Dict] = SingleFlight()
+        self._playlist_pages: SingleFlight[
+            Tuple[str, Optional[str]], Tuple[Optional[List[str]], Optional[str]]
+        ] = SingleFlight()
+        self._searches: SingleFlight[str, Optional[Dict]] = SingleFlight()
+        # Metadata lookups of all guilds are sent together, up to 50 IDs per request
+        self._video_batcher: MicroBatcher[str, Dict] = MicroBatcher(
+            self._lookup_video_items,
+            window=env_float("DJGARO_METADATA_BATCH_WINDOW", METADATA_BATCH_WINDOW),
+            max_batch=YT_API_VIDEODATA_MAX_IDS,
+        )
+        self._http: Optional[ClientSession] = None
+        self._metadata_cache = create_metadata_cache()
+        self._audio_cache = create_audio_cache(
+            self._worker_index, getattr(bot, "worker_count", 1)
+        )
+        self._ffmpeg = create_ffmpeg_governor()
+        self._watchdog = LoopWatchdog(
+            threshold=env_float("DJGARO_LOOP_STALL_THRESHOLD", LOOP_STALL_THRESHOLD)
+        )
+        self._prefetch_window = env_int("DJGARO_PREFETCH_WINDOW", PREFETCH_WINDOW)
+        self._preload_seconds = env_float("DJGARO_PRELOAD_SECONDS", PRELOAD_SECONDS)
+        self._extraction_limit = Semaphore(
+            env_int("DJGARO_EXTRACTION_CONCURRENCY", EXTRACTION_CONCURRENCY)
+        )
+
+    async def cog_load(self) -> None:
+        self._warm_up_task = create_task(self._warm_up_extractor())
+        self._watchdog.start()
+        if self._audio_cache is not None:
+            await to_thread(self._audio_cache.load)
+        if self._snapshot_path:
+            snapshots = await to_thread(
+                load_snapshot,
+                self._snapshot_path,
+                env_float("DJGARO_SNAPSHOT_MAX_AGE", SNAPSHOT_MAX_AGE),
+            )
+            if snapshots:
+                self._restore_task = create_task(self._restore_players(snapshots))
+
+    async def cog_unload(self) -> None:
+        self._watchdog.stop()
+        if self._warm_up_task:
+            self._warm_up_task.cancel()
+        if self._restore_task:
+            self._restore_task.cancel()
+
+        snapshots = []
+        if self._snapshot_path:
+            snapshots = [
+                snapshot
+                for snapshot in map(snapshot_player, self.players)
+                if snapshot is not None
+            ]
+
+        for task in list(self._url_refresh_tasks.values()):
+            task.cancel()
+        self._url_refresh_tasks.clear()
+        for task in list(self._idle_disconnects.values()):
+            task.cancel()
+        self._idle_disconnects.clear()
+        self._video_batcher.cancel()
+
+        for player in self.players:
+            player.cancel_loading()
+            player.discard_preloaded()
+            player.prefetcher.cancel()
+            if self._snapshot_path:
+                # The next cog continues the song from the snapshot, this one must not advance the queue
+                player.stop()
+        # Songs that are playing keep playing, everything else is killed
+        self._ffmpeg.reap(
+            keep=[voice_client.source for voice_client in self._bot.voice_clients]
+        )
+        if self._snapshot_path:
+            try:
+                await to_thread(save_snapshot, self._snapshot_path, snapshots)
+                LOGGER.info(f"[Snapshot] - Saved {len(snapshots)} players")
+            except OSError as exc:
+                LOGGER.error(f"[Snapshot] - Saving the players failed: {exc}")
+
+        if self._http and not self._http.closed:
+            await self._http.close()
+        self._http = None
+
+        self._extractor.shutdown()
+
+        if self._metadata_cache:
+            await self._metadata_cache.close()
+
+    async def _restore_players(self, snapshots: List[PlayerSnapshot]) -> None:
+        """Picks up the sessions the previous cog saved on unload, e.g. before a reload or restart"""
+
+        await self._bot.wait_until_ready()
+        restored = 0
+        for snapshot in snapshots:
+            try:
+                with PLAY_STATS.timer("restore.player", snapshot.guild_id):
+                    restored += await self._restore_player(snapshot)
+            except Exception as exc:
+                LOGGER.error(
+                    f"[Snapshot] - Restoring the player of guild {snapshot.guild_id} failed: {exc}"
+                )
+        LOGGER.info(f"[Snapshot] - Restored {restored} of {len(snapshots)} players")
+
+    async def _restore_player(self, snapshot: PlayerSnapshot) -> bool:
+        guild = self._bot.get_guild(snapshot.guild_id)
+        if guild is None:
+            # The bot left the guild
+            return False
+
+        text_channel = guild.get_channel(snapshot.text_channel_id or 0)
+        resume = snapshot.state != "stopped" and text_channel is not None
+        # After a reload the bot is still connected, also when nothing is played
+        voice_client = guild.voice_client
+        if voice_client is None and resume:
+            voice_channel = guild.get_channel(snapshot.voice_channel_id or 0)
+            if voice_channel is not None and any(
+                not member.bot for member in voice_channel.members
+            ):
+                voice_client = await voice_channel.connect()
+        existing = self.players.peek(snapshot.guild_id)
+        if voice_client is None or (existing and existing.playlist):
+            # Players only exist while the bot is in a voice channel, or the guild
+            # started playing something else already
+            return False
+
+        player = self.players.get(snapshot.guild_id)
+        player.playlist = SongQueue(snapshot.playlist_items())
+        player.song_idx = min(snapshot.song_idx, len(player.playlist) - 1)
+        player.repeat_mode = snapshot.loop_mode
+        # Stream URLs which are still valid are reused, expired ones are dropped so the
+        # prefetcher extracts them again
+        for item in player.playlist:
+            if self._url_cache.is_usable(item.raw_url):
+                self._url_cache.put(
+                    item.video_id, StreamInfo(item.raw_url, item.acodec, item.abr)
+                )
+            else:
+                item.raw_url, item.acodec, item.abr = "", "", 0.0
+
+        player.text_channel = text_channel
+        player.voice_client = voice_client
+        if not resume:
+            return True
+
+        async with player.transition_lock:
+            if not await self._resolve_raw_url(player.current):
+                return True
+            audio_source = await self._audio_source(
+                player, player.current, start_at=snapshot.position
+            )
+            if audio_source is None:
+                return True
+            self._start_playing(
+                guild, text_channel, player, audio_source, snapshot.position
+            )
+            if snapshot.state == "paused":
+                player.pause()
+        player.prefetcher.schedule()
+        return True
+
+    async def _warm_up_extractor(self) -> None:
+        """Loads yt_dlp in the background once the bot is connected, so the first song doesn't wait for it"""
+
+        await self._bot.wait_until_ready()
+        try:
+            with PLAY_STATS.timer("startup.extractor_warm_up"):
+                await self._extractor.warm_up()
+        except Exception as exc:
+            LOGGER.error(f"[Extraction] - Warming up the extractor failed: {exc}")
+
+    def _schedule_idle_disconnect(
+        self, guild_id: int, voice_client: VoiceClient
+    ) -> None:
+        if guild_id not in self._idle_disconnects:
+            task = create_task(self._disconnect_when_idle(guild_id, voice_client))
+            self._idle_disconnects[guild_id] = task
+
+            def forget(done: Task) -> None:
+                if self._idle_disconnects.get(guild_id) is done:
+                    del self._idle_disconnects[guild_id]
+
+            task.add_done_callback(forget)
+
+    def _discard_player(self, guild_id: int) -> None:
+        """Drops the guild's player, its latency stats and the ffmpeg processes it left behind"""
+
+        player = self.players.peek(guild_id)
+        playing = getattr(player.voice_client, "source", None) if player else None
+        self.players.discard(guild_id)
+        PLAY_STATS.forget_guild(guild_id)
+        # The stopped stream is cleaned up by its own audio player thread
+        self._ffmpeg.reap(guild_id, keep=[playing])
+
+    def _cancel_idle_disconnect(self, guild_id: int) -> None:
+        task = self._idle_disconnects.pop(guild_id, None)
+        if task:
+            task.cancel()
+
+    async def _disconnect_when_idle(
+        self, guild_id: int, voice_client: VoiceClient
+    ) -> None:
+        """Leaves the voice channel if nobody joined it again within the idle grace period"""
+
+        await sleep(self._idle_disconnect_delay)
+        channel = voice_client.channel
+        if any(not member.bot for member in channel.members):
+            return None
+        LOGGER.info(f"[Voice Leave] - Leaving idle channel {channel.name}")
+        try:
+            self._discard_player(guild_id)
+            await voice_client.disconnect(force=False)
+        except Exception as error:
+            LOGGER.error(f"{error}")
+
+    def _http_session(self) -> ClientSession:
+        """Returns the cog's pooled HTTP client, creating it on first use"""
+        if self._http is None or self._http.closed:
+            self._http = create_http_session()
+        return self._http
+
+    async def cog_check(self, ctx: Context) -> bool:
+        # Every command operates on the player of a guild
+        return ctx.guild is not None
+
+    def _player(self, ctx: Context) -> GuildPlayer:
+        """The guild's player, created if needed, only for commands that join a voice channel"""
+        return self.players.get(ctx.guild.id)
+
+    def _peek_player(self, ctx: Context) -> Optional[GuildPlayer]:
+        """The guild's player, None if the bot hasn't joined a voice channel of the guild"""
+        return self.players.peek(ctx.guild.id)
+
+    def _create_player(self, guild_id: int) -> GuildPlayer:
+        player = GuildPlayer(guild_id)
+        player.prefetcher = Prefetcher(
+            player, self._resolve_raw_url, self._prefetch_window, self._extraction_limit
+        )
+        return player
+
+    def collect_metrics(self) -> List[Metric]:
+        """Current state of the voice connections, queues, caches and coalesced lookups"""
+
+        players = list(self.players)
+        queue_lengths = Metric(
+            "djgaro_queue_length", "gauge", "Songs in the queue of every server"
+        )
+        for player in players:
+            queue_lengths.add(len(player.playlist), guild=str(player.guild_id))
+
+        cache_hits = Metric("djgaro_cache_hits_total", "counter", "Cache hits")
+        cache_misses = Metric("djgaro_cache_misses_total", "counter", "Cache misses")
+        cache_hit_ratio = Metric(
+            "djgaro_cache_hit_ratio",
+            "gauge",
+            "Share of the cache lookups that were hits",
+        )
+        caches = {
+            "url": self._url_cache,
+            "metadata": self._metadata_cache,
+            "audio": self._audio_cache,
+        }
+        for name, cache in caches.items():
+            if not cache:
+                continue
+            lookups = cache.hits + cache.misses
+            cache_hits.add(cache.hits, cache=name)
+            cache_misses.add(cache.misses, cache=name)
+            cache_hit_ratio.add(cache.hits / lookups if lookups else 0.0, cache=name)
+
+        coalesced = Metric(
+            "djgaro_coalesced_lookups_total",
+            "counter",
+            "Lookups answered by an identical lookup already in flight",
+        )
+        for name, flight in (
+            ("extraction", self._extractions),
+            ("video", self._video_lookups),
+            ("playlist_page", self._playlist_pages),
+            ("search", self._searches),
+        ):
+            coalesced.add(flight.coalesced, kind=name)
+
+        return [
+            Metric("djgaro_voice_clients", "gauge", "Connected voice clients").add(
+                len(self._bot.voice_clients)
+            ),
+            Metric("djgaro_ffmpeg_processes", "gauge", "Running ffmpeg processes").add(
+                len(self._ffmpeg)
+            ),
+            Metric(
+                "djgaro_ffmpeg_transcodes", "gauge", "Running ffmpeg transcodes"
+            ).add(self._ffmpeg.transcodes),
+            Metric(
+                "djgaro_ffmpeg_degraded_transcodes_total",
+                "counter",
+                "Transcodes started with degraded settings because every slot was taken",
+            ).add(self._ffmpeg.degraded),
+            Metric("djgaro_players", "gauge", "Servers with a player").add(
+                len(players)
+            ),
+            queue_lengths,
+            Metric(
+                "djgaro_api_batches_total",
+                "counter",
+                "Video metadata requests sent by the batcher",
+            ).add(self._video_batcher.batches),
+            cache_hits,
+            cache_misses,
+            cache_hit_ratio,
+            coalesced,
+            Metric(
+                "djgaro_loop_stalls_total",
+                "counter",
+                "Times the event loop was blocked for longer than the stall threshold",
+            ).add(self._watchdog.stalls),
+        ]
 
     ############################################# Event Listeners #############################################
     @Cog.listener(name="on_voice_state_update")
     async def voice_state_change(
         self, member: Member, state_before: VoiceState, state_after: VoiceState
     ) -> None:
+        guild_id = member.guild.id
+        bot_user = self._bot.user
+        is_bot = bot_user is not None and member.id == bot_user.id
+        if is_bot and state_after.channel is None:
+            # Disconnected, e.g. kicked out of the channel
+            self._cancel_idle_disconnect(guild_id)
+            self._discard_player(guild_id)
+            return None
 
-        voice_client = get(self._bot.voice_clients, guild=member.guild)
-        if voice_client:
-            try:
-                members = voice_client.channel.members
-                if len(members) == 1 and members[0].bot == True:
-                    await voice_client.disconnect(force=False)
-                    self.voice_client = None
-            except AttributeError:
-                pass
-            except Exception as error:
-                LOGGER.error(f"{error}")
+        # Also connections the player doesn't know about(e.g. after a reload)
+        voice_client = member.guild.voice_client
+        if voice_client is None:
+            return None
+
+        channel = voice_client.channel
+        before = state_before.channel.id if state_before.channel else None
+        after = state_after.channel.id if state_after.channel else None
+        # Mutes, deafens and the like, or members of other channels
+        if not is_bot and (before == after or channel.id not in (before, after)):
+            return None
+
+        if any(not member.bot for member in channel.members):
+            self._cancel_idle_disconnect(guild_id)
+        else:
+            self._schedule_idle_disconnect(guild_id, voice_client)
 
     ############################################# Commands ####################################################
     @command(name="join", aliases=["j", "jn"])
@@ -89,7 +459,7 @@ class MusicCog(Cog):
 
         if voice_state and not ctx.voice_client:
             voice_client = await voice_state.channel.connect()
-            self.voice_client = voice_client
+            self._player(ctx).voice_client = voice_client
             LOGGER.info(f"[Voice Join] - BOT connected to {voice_client.channel.name}")
         else:
             author = ctx.author.display_name
@@ -101,6 +471,8 @@ class MusicCog(Cog):
             LOGGER.info(
                 f"[Voice Leave] - Leaving channel {ctx.voice_client.channel.name}"
             )
+            self._cancel_idle_disconnect(ctx.guild.id)
+            self._discard_player(ctx.guild.id)
             await ctx.voice_client.disconnect(force=False)
         else:
             await ctx.send(f"Not currenty in a voice channel.")
@@ -108,6 +480,8 @@ class MusicCog(Cog):
     @command(name="play", aliases=["paly"])
     async def play_audio(self, ctx: Context, *, query: str = ""):
 
+        started = monotonic()
+        guild_id = ctx.guild.id
         if not query:
             await ctx.reply(
                 "Please provide search query or a youtube video url or playlist url"
@@ -123,160 +497,167 @@ class MusicCog(Cog):
             return None
 
         if not voice_client:
-            voice_client = await voice_state.channel.connect()
-
-        self.voice_client = voice_client
-        if voice_client.is_playing():
-            self.stopped = True
-            voice_client.stop()
-
-        self.song_idx = 0
-        self.stopped = False
-        self.playlist = []
+            with PLAY_STATS.timer("play.voice_connect", guild_id):
+                voice_client = await voice_state.channel.connect()
 
-        def handle_finished_stream(e):
-            if e:
-                LOGGER.error(f"AudioStream Player Error: {e}")
-            if not self.stopped:
-                self._bot.loop.create_task(self._play_next_song(ctx))
+        player = self._player(ctx)
+        player.voice_client = voice_client
+        player.reset()
 
-            self.stopped = False
+        # The rest of the playlist keeps loading in the background while the first song plays
+        playlist = player.playlist
+        player.start_loading(
+            self._init_internal_playlist(player, self._video_ids(query=query))
+        )
 
         async with ctx.channel.typing() as t:
-            yt_video_ids = await self._video_ids(query=query)
-            await self._init_internal_playlist(yt_video_ids)
+            with PLAY_STATS.timer("play.first_metadata", guild_id):
+                await player.wait_for_items()
 
-            self.playlist[self.song_idx].raw_url = await async_to_thread(
-                self._extract_raw_url, self.playlist[self.song_idx].yt_url
-            )
-            if not self.playlist[self.song_idx].raw_url:
+            with PLAY_STATS.timer("play.resolve", guild_id):
+                first_index = await self._first_resolvable_index(
+                    player, player.next_playable_index(0), player.next_playable_index
+                )
+            if playlist is not player.playlist:
+                # Superseded by a newer '!play' while resolving
+                return None
+            if first_index is None:
                 await ctx.reply(f"Sorry, no such song can be found.")
                 return None
 
-            audio_source = await FFmpegOpusAudio.from_probe(
-                self.playlist[self.song_idx].raw_url
-            )
-            voice_client.play(audio_source, after=handle_finished_stream)
-
-        if (self.song_idx + 1) < len(self.playlist):
-            await self._fetch_next_song_url()
+            async with player.transition_lock:
+                if playlist is not player.playlist:
+                    return None
+                # A '!next' may have started a song in the meantime
+                player.stop()
+                player.song_idx = first_index
+                with PLAY_STATS.timer("play.audio_source", guild_id):
+                    audio_source = await self._audio_source(player, player.current)
+                if audio_source is None:
+                    await ctx.reply(f"Sorry, no such song can be found.")
+                    return None
+                self._start_playing(ctx.guild, ctx.channel, player, audio_source)
+            PLAY_STATS.observe("play.time_to_audio", monotonic() - started, guild_id)
+
+        player.prefetcher.schedule()
 
     @command(name="pause", aliases=["p"])
     async def pause_voice(self, ctx: Context):
         voice_state = ctx.author.voice
         voice_client = ctx.voice_client
+        player = self._peek_player(ctx)
         if not voice_state:
             await ctx.reply(
                 f"{ctx.author} - you must be in voice channel to use this command!"
             )
         elif not voice_client:
             await ctx.reply(f"The bot is not in a voice channel!")
-        elif not voice_client.is_playing():
+        elif not voice_client.is_playing() or player is None:
             await ctx.reply(f"There's nothing to pause!")
         else:
-            voice_client.pause()
+            player.pause()
 
     @command(name="resume", aliases=["continue", "cont", "res"])
     async def resume_voice(self, ctx: Context):
         voice_state = ctx.author.voice
         voice_client = ctx.voice_client
+        player = self._peek_player(ctx)
         if not voice_state:
             await ctx.reply(
                 f"{ctx.author} - you must be in voice channel to use this command!"
             )
-        elif voice_client and voice_client.is_paused():
-            voice_client.resume()
+        elif voice_client and voice_client.is_paused() and player:
+            player.resume()
 
     @command(name="stop", aliases=["stp", "s"])
     async def stop_voice(self, ctx: Context):
         voice_state = ctx.author.voice
         voice_client = ctx.voice_client
+        player = self._peek_player(ctx)
         if not voice_state:
             await ctx.reply(
                 f"{ctx.author} - you must be in voice channel to use this command!"
             )
-        elif voice_client is not None:
+        elif voice_client is not None and player:
             LOGGER.info(
                 f'[Voice Stop] - Stopping the voice streaming in voice channel "{voice_state.channel}"...'
             )
-            self.stopped = True
-            voice_client.stop()
+            playing = voice_client.source
+            player.stop()
+            self._ffmpeg.reap(ctx.guild.id, keep=[playing, player.preloaded_source])
 
     @command(name="next", aliases=["nxt", "nt"])
     async def next_song(self, ctx: Context):
 
         voice_client = ctx.voice_client
-        if not voice_client:
+        player = self._peek_player(ctx)
+        if not voice_client or player is None:
             await ctx.reply("Not in a voice channel or nothing is playing!")
             return None
 
-        if voice_client.is_playing():
-            self.stopped = True
-            voice_client.stop()
-
-        await self._play_next_song(ctx, invoked_by_cmd=True)
+        player.voice_client = voice_client
+        # Several '!next's in a row skip one song each, one after the other
+        async with player.transition_lock:
+            player.stop()
+            await self._play_next_song(ctx.guild, ctx.channel, invoked_by_cmd=True)
 
     @command(name="previous", aliases=["prev"])
     async def previous_song(self, ctx: Context):
 
         voice_client = ctx.voice_client
-        if not voice_client:
+        player = self._peek_player(ctx)
+        if not voice_client or player is None:
             await ctx.reply("Not in a voice channel or nothing is playing!")
             return None
 
-        def handle_finished_stream(e):
-            if e:
-                LOGGER.error(f"AudioStream Player Error: {e}")
-            if not self.stopped:
-                self._bot.loop.create_task(self._play_next_song(ctx))
-
-            self.stopped = False
-
-        if self.song_idx > 0:
-            self.song_idx -= 1
-            while not self.playlist[self.song_idx].raw_url and self.song_idx > 0:
-                self.song_idx -= 1
-        else:
-            await ctx.reply(
-                f"There is no previous song, the currently playing song is first"
+        player.voice_client = voice_client
+        async with player.transition_lock:
+            previous_index = await self._first_resolvable_index(
+                player,
+                player.previous_playable_index(player.song_idx - 1),
+                lambda index: player.previous_playable_index(index - 1),
             )
-            return None
+            if previous_index is None:
+                await ctx.reply(
+                    f"There is no previous song, the currently playing song is first"
+                )
+                return None
 
-        if voice_client.is_playing():
-            self.stopped = True
-            voice_client.stop()
+            player.stop()
+            player.song_idx = previous_index
 
-        source_url = self.playlist[self.song_idx].raw_url
-        audio_source = await FFmpegOpusAudio.from_probe(source_url)
-        voice_client.play(audio_source, after=handle_finished_stream)
+            audio_source = await self._audio_source(player, player.current)
+            if audio_source is None:
+                await ctx.reply("Sorry, the previous song cannot be played anymore.")
+                return None
+            self._start_playing(ctx.guild, ctx.channel, player, audio_source)
+        player.prefetcher.schedule()
 
     @command(name="rewind", aliases=["rw", "re"])
     async def rewind_current_song(self, ctx: Context):
 
         voice_client = ctx.voice_client
-        if not voice_client or not self.playlist:
+        player = self._peek_player(ctx)
+        if not voice_client or player is None or not player.playlist:
             await ctx.reply("Not in a voice channel or nothing is playing!")
             return None
 
-        def handle_finished_stream(e):
-            if e:
-                LOGGER.error(f"AudioStream Player Error: {e}")
-            if not self.stopped:
-                self._bot.loop.create_task(self._play_next_song(ctx))
+        player.voice_client = voice_client
+        async with player.transition_lock:
+            player.stop()
 
-            self.stopped = False
-
-        if voice_client.is_playing():
-            self.stopped = True
-            voice_client.stop()
-
-        source_url = self.playlist[self.song_idx].raw_url
-        audio_source = await FFmpegOpusAudio.from_probe(source_url)
-        voice_client.play(audio_source, after=handle_finished_stream)
+            audio_source = None
+            if await self._resolve_raw_url(player.current):
+                audio_source = await self._audio_source(player, player.current)
+            if audio_source is None:
+                await ctx.reply("Sorry, the current song cannot be played anymore.")
+                return None
+            self._start_playing(ctx.guild, ctx.channel, player, audio_source)
 
     @command(name="repeat", aliases=["rpt", "rep"])
     async def set_repeat_mode(self, ctx: Context, *, repeat_mode: str = ""):
-        if repeat_mode.strip().lower() not in self.loop_modes.keys():
+        repeat_mode = repeat_mode.strip().lower()
+        if repeat_mode not in self.loop_modes.keys():
             reply = Embed(color=0x1DC337, title="Invalid repeat mode")
             reply.add_field(name="Available modes:", value="", inline=False)
             reply.add_field(name="all", value="")
@@ -285,7 +666,81 @@ class MusicCog(Cog):
             await ctx.reply(embed=reply)
             return None
 
-        self.repeat_mode = self.loop_modes[repeat_mode]
+        player = self._peek_player(ctx)
+        if not ctx.voice_client or player is None:
+            await ctx.reply("Not in a voice channel!")
+            return None
+        if player.repeat_mode != self.loop_modes[repeat_mode]:
+            # The song after the current one may be a different one now
+            player.discard_preloaded()
+        player.repeat_mode = self.loop_modes[repeat_mode]
+
+    @command(name="shuffle", aliases=["shf", "mix"])
+    async def shuffle_playlist(self, ctx: Context):
+        player = self._peek_player(ctx)
+        if not ctx.voice_client or player is None or not player.playlist:
+            await ctx.reply("Not in a voice channel or empty playlist!")
+            return None
+
+        player.shuffle()
+        player.prefetcher.schedule()
+        await ctx.reply(f"Shuffled {len(player.playlist)} songs.")
+
+    @command(name="playnext", aliases=["pn"])
+    async def play_next(self, ctx: Context, *, query: str = ""):
+        player = self._peek_player(ctx)
+        if not query:
+            await ctx.reply(
+                "Please provide search query or a youtube video url or playlist url"
+            )
+            return None
+        if not ctx.voice_client or player is None or not player.playlist:
+            await ctx.reply("Nothing is playing, use !play to start a playlist.")
+            return None
+
+        # Only the first page of a playlist, at most 50 songs
+        video_ids = await anext(aiter(self._video_ids(query=query)), [])
+        video_metadata_response = (
+            await self._fetch_video_metadata(yt_video_ids=video_ids)
+            if video_ids
+            else None
+        )
+        songs = SongQueue()
+        if video_metadata_response:
+            await self._append_playlist_items(songs, video_metadata_response)
+        if not songs:
+            await ctx.reply(f"Sorry, no such song can be found.")
+            return None
+
+        async with player.transition_lock:
+            for offset, item in enumerate(songs, start=1):
+                player.insert(player.song_idx + offset, item)
+        player.prefetcher.schedule()
+        if len(songs) == 1:
+            await ctx.reply(f"Playing next: {songs[0].title}")
+        else:
+            await ctx.reply(f"Playing {len(songs)} songs next.")
+
+    @command(name="remove", aliases=["rm"])
+    async def remove_song(self, ctx: Context, position: int = 0):
+        player = self._peek_player(ctx)
+        if not ctx.voice_client or player is None or not player.playlist:
+            await ctx.reply("Not in a voice channel or empty playlist!")
+            return None
+
+        async with player.transition_lock:
+            index = position - 1
+            if not 0 <= index < len(player.playlist):
+                await ctx.reply(
+                    f"Please provide a song number between 1 and {len(player.playlist)}, as shown by !listsongs"
+                )
+                return None
+            if index == player.song_idx:
+                await ctx.reply("The song is playing right now, use !next to skip it.")
+                return None
+            item = player.remove(index)
+        player.prefetcher.schedule()
+        await ctx.reply(f"Removed [{position}]: {item.title}")
 
     @command(name="reload")
     async def reload_ext(self, ctx: Context, extension_name: str):
@@ -299,14 +754,55 @@ class MusicCog(Cog):
         else:
             await ctx.reply(f"Extension with name {extension_name} cannot be found!")
 
+    @command(name="stats")
+    @has_guild_permissions(administrator=True)
+    async def show_stats(self, ctx: Context):
+        overall_embed = self._stats_embed("Latency - all servers", PLAY_STATS.summary())
+        overall_embed.set_footer(
+            text=f"Event loop stalls longer than {self._watchdog.threshold}s: {self._watchdog.stalls}"
+        )
+        guild_embed = self._stats_embed(
+            f"Latency - {ctx.guild.name}", PLAY_STATS.summary(ctx.guild.id)
+        )
+        await ctx.send(embeds=[overall_embed, guild_embed])
+
+    def _stats_embed(
+        self, title: str, rows: List[Tuple[str, int, float, float, float]]
+    ) -> Embed:
+        reply_embed = Embed(color=Colour.blue(), title=title)
+        if not rows:
+            reply_embed.description = "No data yet"
+
+        # Embeds are limited to 25 fields
+        for stage, count, p50, p95, p99 in rows[:25]:
+            reply_embed.add_field(
+                name=stage,
+                value=f"p50 {p50 * 1000:.0f}ms | p95 {p95 * 1000:.0f}ms | p99 {p99 * 1000:.0f}ms | n={count}",
+                inline=False,
+            )
+        return reply_embed
+
     @command(name="listsongs", aliases=["ls"])
     async def list_current_song_queue(self, ctx: Context):
 
-        if not ctx.voice_client or not self.playlist:
+        player = self._peek_player(ctx)
+        if ctx.voice_client and player and not player.playlist and player.is_loading:
+            await ctx.reply("The playlist is still loading\u2026")
+            return None
+        if not ctx.voice_client or player is None or not player.playlist:
             await ctx.reply("Not in a voice channel or empty playlist")
+            return None
 
         reply_embed = Embed(color=Colour.blue(), title="Playlist")
-        song_count = len(self.playlist)
+        if player.is_loading:
+            reply_embed.set_footer(
+                text=f"loading\u2026 {len(player.playlist)} songs loaded so far"
+            )
+        else:
+            reply_embed.set_footer(
+                text=f"{len(player.playlist)} songs, {format_duration(player.playlist.total_duration)}"
+            )
+        song_count = len(player.playlist)
         song_list_cnt, half_song_cnt = (
             min(self.ITEM_LISTING_COUNT, song_count),
             min(self.ITEM_LISTING_COUNT, song_count) // 2,
@@ -314,12 +810,13 @@ class MusicCog(Cog):
 
         for i, j in zip(range(song_list_cnt), range(-half_song_cnt, half_song_cnt + 1)):
             index = (
-                max(self.song_idx + j, i)
-                if self.song_idx < (song_count - half_song_cnt)
+                max(player.song_idx + j, i)
+                if player.song_idx < (song_count - half_song_cnt)
                 else (song_count + i - song_list_cnt)
             )
+            marker = "\u27a1 " if player.song_idx == index else ""
             reply_embed.add_field(
-                name=f'{'\u27a1 ' if self.song_idx == index else ''} [{index + 1}] : {self.playlist[index].title}  [{self.playlist[index].duration}]',
+                name=f"{marker} [{index + 1}] : {player.playlist[index].title}  [{player.playlist[index].duration_text}]",
                 value="",
                 inline=False,
             )
@@ -328,100 +825,277 @@ class MusicCog(Cog):
 
     @command(name="currentsong", aliases=["cs", "lcs"])
     async def list_current_song(self, ctx: Context):
-        if not ctx.voice_client or not self.playlist:
+        player = self._peek_player(ctx)
+        if not ctx.voice_client or player is None or not player.playlist:
             await ctx.reply("Not in a voice channel or empty playlist!")
             return None
 
         reply_embed = Embed(color=Colour.blue(), title="Currently playing:")
         reply_embed.add_field(
-            name=f"[{self.song_idx + 1}]: {self.playlist[self.song_idx].title}  [{self.playlist[self.song_idx].duration}]",
+            name=f"[{player.song_idx + 1}]: {player.current.title}  [{player.current.duration_text}]",
             value="",
         )
         await ctx.send(embed=reply_embed)
 
-    async def _fetch_next_song_url(self):
+    async def _first_resolvable_index(
+        self,
+        player: GuildPlayer,
+        index: Optional[int],
+        advance: Callable[[int], Optional[int]],
+    ) -> Optional[int]:
+        """Follows `advance` from `index` until a song whose stream URL can be resolved is found.
+
+        Songs which fail to resolve are marked as failed, so `advance` skips them and the search ends.
+        """
+
+        playlist = player.playlist
+        while index is not None and playlist is player.playlist:
+            if await self._resolve_raw_url(playlist[index]):
+                return index
+            index = advance(index)
+        return None
+
+    async def _resolve_raw_url(self, item: PlaylistItem) -> str:
+        """Returns a playable raw audio URL for the item, extracting it only if no usable URL is cached.
+
+        Songs stored in the audio cache need no URL, the path of their local file is returned.
+        """
+
+        if self._audio_cache is not None and item.video_id in self._audio_cache:
+            item.failed = False
+            return self._audio_cache.path(item.video_id)
+
+        stream_info = self._url_cache.get(item.video_id)
+        if not stream_info and self._url_cache.is_usable(item.raw_url):
+            stream_info = StreamInfo(item.raw_url, item.acodec, item.abr)
+            self._url_cache.put(item.video_id, stream_info)
+
+        if not stream_info:
+            stream_info = await self._extractions.run(
+                item.video_id, lambda: self._extract_stream_info(item)
+            )
+        elif self._url_cache.expires_soon(item.video_id):
+            self._refresh_raw_url_in_background(item)
+
+        item.raw_url, item.acodec, item.abr = (
+            stream_info.url,
+            stream_info.acodec,
+            stream_info.abr,
+        )
+        item.failed = not item.raw_url
+        return item.raw_url
+
+    async def _extract_stream_info(self, item: PlaylistItem) -> StreamInfo:
+        with PLAY_STATS.timer("extract"):
+            stream_info = await self._extractor.extract(item.yt_url)
+        if not stream_info.url:
+            PLAY_STATS.error("extract")
+        self._url_cache.put(item.video_id, stream_info)
+        return stream_info
+
+    async def _audio_source(
+        self, player: GuildPlayer, item: PlaylistItem, start_at: float = 0.0
+    ) -> Optional[GovernedOpusAudio]:
+        """Creates the audio source of a resolved song, starting `start_at` seconds into it.
+
+        Songs in the audio cache are played from disk, None is returned if such a song got evicted
+        and can't be extracted anymore. Opus streams are passed through to discord
+        as they are(no re-encoding) and copied into the audio cache while they play. Other codecs
+        are transcoded at the bitrate of the voice channel, within the limit of the ffmpeg governor.
+        """
+
+        source_args = {"governor": self._ffmpeg, "guild_id": player.guild_id}
+        if start_at > 0:
+            source_args["before_options"] = f"-ss {start_at:.1f}"
+        bitrate = round(item.abr) or None
+        if self._audio_cache is not None:
+            cached_path = self._audio_cache.lookup(item.video_id)
+            if cached_path:
+                return GovernedOpusAudio(
+                    cached_path, bitrate=bitrate, codec="copy", **source_args
+                )
+            # The song was resolved from the audio cache but got evicted since
+            if not item.raw_url and not await self._resolve_raw_url(item):
+                return None
 
-        next_index = self.song_idx + 1
-        raw_url = ""
-        while True:
-            raw_url = await async_to_thread(
-                self._extract_raw_url, self.playlist[next_index].yt_url
+        # Only streams of an unknown codec need an ffprobe run
+        codec = item.acodec or (await GovernedOpusAudio.probe(item.raw_url))[0]
+        if codec in PASSTHROUGH_ACODECS:
+            # A song which doesn't start at the beginning can't be cached
+            if self._audio_cache is not None and start_at <= 0:
+                return CachingOpusAudio(
+                    item.raw_url,
+                    cache=self._audio_cache,
+                    video_id=item.video_id,
+                    bitrate=bitrate,
+                    **source_args,
+                )
+            return GovernedOpusAudio(
+                item.raw_url, bitrate=bitrate, codec="copy", **source_args
             )
-            if raw_url:
-                break
 
-            next_index += 1
+        bitrate, options = channel_bitrate(player.voice_client, item.abr), None
+        holds_slot = await self._ffmpeg.acquire_transcode()
+        if not holds_slot:
+            bitrate, options = degraded_options(bitrate)
+            LOGGER.warning(
+                f"[FFmpeg] - All {self._ffmpeg.max_transcodes} transcode slots are taken, "
+                f"transcoding {item.video_id} at {bitrate}kbps with the fastest settings"
+            )
+        try:
+            return GovernedOpusAudio(
+                item.raw_url,
+                bitrate=bitrate,
+                options=options,
+                holds_slot=holds_slot,
+                **source_args,
+            )
+        except Exception:
+            if holds_slot:
+                self._ffmpeg.release_transcode()
+            raise
+
+    def _refresh_raw_url_in_background(self, item: PlaylistItem) -> None:
+        if item.video_id in self._url_refresh_tasks:
+            return None
+
+        async def refresh():
+            stream_info = await self._extractions.run(
+                item.video_id, lambda: self._extract_stream_info(item)
+            )
+            if stream_info.url:
+                LOGGER.info(f"[URL Cache] - Refreshed stream url for {item.video_id}")
 
-        self.playlist[next_index].raw_url = raw_url
+        task = create_task(refresh())
+        self._url_refresh_tasks[item.video_id] = task
+        task.add_done_callback(
+            lambda _: self._url_refresh_tasks.pop(item.video_id, None)
+        )
+
+    async def _play_next_song(
+        self, guild: Guild, channel: Messageable, *, invoked_by_cmd: bool = False
+    ):
+        """Moves the guild's player to the next song, callers hold the player's transition lock"""
 
-    async def _play_next_song(self, ctx: Context, *, invoked_by_cmd: bool = False):
+        if not guild.voice_client:
+            await channel.send("Not connected to a voice channel!")
+            return None
 
-        if not ctx.voice_client:
-            await ctx.send("Not connected to a voice channel!")
+        started = monotonic()
+        guild_id = guild.id
+        player = self.players.peek(guild_id)
+        if player is None:
+            # Discarded, e.g. the bot left the voice channel
             return None
 
-        def handle_finished_stream(e):
-            if e:
-                LOGGER.error(f"AudioStream Player Error: {e}")
-            if not self.stopped:
-                self._bot.loop.create_task(self._play_next_song(ctx))
+        playlist, token = player.playlist, player.play_token
+
+        def superseded() -> bool:
+            # A '!play' or '!stop' changed the player while this one was waiting
+            return playlist is not player.playlist or token != player.play_token
+
+        # Don't wrap around or stop at the end of a playlist that is still loading
+        await player.wait_for_items(player.song_idx + 2)
+        if superseded():
+            return None
+
+        next_index = self._next_index(player, invoked_by_cmd=invoked_by_cmd)
+        audio_source = (
+            player.take_preloaded(next_index) if next_index is not None else None
+        )
+        if audio_source is None:
+            # The URL may have been resolved long ago, e.g. on a REPEAT_ALL wrap-around
+            with PLAY_STATS.timer("next.resolve", guild_id):
+                next_index = await self._next_resolvable_index(player, next_index)
+            if next_index is None or superseded():
+                return None
 
-            self.stopped = False
+        player.song_idx = next_index
+        player.voice_client = guild.voice_client
+        if audio_source is None:
+            with PLAY_STATS.timer("next.audio_source", guild_id):
+                audio_source = await self._audio_source(player, player.current)
+            if audio_source is None and not superseded():
+                # The song is marked as failed now, the following one is played instead
+                return await self._play_next_song(guild, channel, invoked_by_cmd=True)
+            if superseded():
+                if audio_source:
+                    audio_source.cleanup()
+                return None
+        self._start_playing(guild, channel, player, audio_source)
+        PLAY_STATS.observe("next.time_to_audio", monotonic() - started, guild_id)
+        player.prefetcher.schedule()
 
-        source_url = ""
-        song_count = len(self.playlist)
-        next_index = self.song_idx + 1
+    def _next_index(
+        self, player: GuildPlayer, *, invoked_by_cmd: bool = False
+    ) -> Optional[int]:
+        """Index of the song that follows the current one in the player's loop mode"""
 
-        match (self.repeat_mode):
+        match (player.repeat_mode):
             case LoopMode.NO_REPEAT:
-                if next_index < song_count:
-                    if not self.playlist[next_index].raw_url:
-                        while not self.playlist[next_index].raw_url:
-                            next_index += 1
-
-                    source_url = self.playlist[next_index].raw_url
-                    self.song_idx = next_index
-            case LoopMode.REPEAT_ONE:
-                if not invoked_by_cmd:
-                    source_url = self.playlist[self.song_idx].raw_url
-                elif next_index < song_count:
-                    if not self.playlist[next_index].raw_url:
-                        while not self.playlist[next_index].raw_url:
-                            next_index += 1
-
-                    source_url = self.playlist[next_index].raw_url
-                    self.song_idx = next_index
-                else:
-                    self.song_idx = 0
-                    source_url = self.playlist[self.song_idx].raw_url
-            case LoopMode.REPEAT_ALL:
-                if next_index < song_count:
-                    if not self.playlist[next_index].raw_url:
-                        while not self.playlist[next_index].raw_url:
-                            next_index += 1
-
-                    source_url = self.playlist[next_index].raw_url
-                    self.song_idx = next_index
-                else:
-                    self.song_idx = 0
-                    source_url = self.playlist[self.song_idx].raw_url
+                return player.next_playable_index(player.song_idx + 1)
+            case LoopMode.REPEAT_ONE if not invoked_by_cmd:
+                return player.song_idx
+            case LoopMode.REPEAT_ONE | LoopMode.REPEAT_ALL:
+                return player.next_playable_index(player.song_idx + 1, wrap=True)
             case _:
-                LOGGER.warning(f"Invalid LoopMode value: {self.repeat_mode}")
+                LOGGER.warning(f"Invalid LoopMode value: {player.repeat_mode}")
+        return None
+
+    async def _next_resolvable_index(
+        self, player: GuildPlayer, index: Optional[int]
+    ) -> Optional[int]:
+        return await self._first_resolvable_index(
+            player,
+            index,
+            lambda index: player.next_playable_index(
+                index + 1, wrap=player.repeat_mode != LoopMode.NO_REPEAT
+            ),
+        )
+
+    def _start_playing(
+        self,
+        guild: Guild,
+        channel: Messageable,
+        player: GuildPlayer,
+        audio_source: AudioSource,
+        offset: float = 0.0,
+    ) -> None:
+        player.text_channel = channel
+        player.play(audio_source, lambda: self._play_next_song(guild, channel), offset)
+        if self._preload_seconds > 0:
+            player.schedule_preload(
+                self._preload_seconds, lambda: self._preload_next_song(player)
+            )
 
-        if source_url:
-            audio_source = await FFmpegOpusAudio.from_probe(source_url)
-            ctx.voice_client.play(audio_source, after=handle_finished_stream)
+    async def _preload_next_song(self, player: GuildPlayer) -> None:
+        """Opens the audio source of the next song so it starts without a gap once the current one ends"""
 
-        # Fetch the 'raw audio resource URL' for the next song in the list if there's none
-        if (
-            self.song_idx + 1 < song_count
-            and not self.playlist[self.song_idx + 1].raw_url
+        playlist = player.playlist
+        await player.wait_for_items(player.song_idx + 2)
+        next_index = await self._next_resolvable_index(player, self._next_index(player))
+        if next_index is None or playlist is not player.playlist:
+            return None
+
+        item = player.playlist[next_index]
+        if self._audio_cache is not None and self._audio_cache.is_writing(
+            item.video_id
         ):
-            await self._fetch_next_song_url()
+            # Played from disk once the stream that is writing it ends(e.g. with REPEAT_ONE)
+            return None
+        with PLAY_STATS.timer("next.preload", player.guild_id):
+            audio_source = await self._audio_source(player, item)
+        if audio_source is None:
+            return None
+        if playlist is not player.playlist or player.playlist[next_index] is not item:
+            # The queue changed while the source was being opened
+            audio_source.cleanup()
+            return None
+        player.set_preloaded(next_index, audio_source)
 
-    async def _video_ids(self, query: str = "") -> list[Optional[str]]:
+    async def _video_ids(self, query: str = "") -> AsyncIterator[List[str]]:
+        """Yields the youtube video IDs for the query in batches of at most 50 IDs"""
 
-        video_ids = []
         if is_url(query):
             parsed_url = parse.urlparse(query)
             hostname, query_params = parsed_url.hostname, parse.parse_qs(
@@ -430,26 +1104,25 @@ class MusicCog(Cog):
 
             if not hostname or ("youtube" not in hostname.lower()):
                 LOGGER.warning(f"The provided url is not a youtube url")
-                return video_ids
+                return
 
             if "list" in query_params:
-                return await self._extract_video_ids_from_list(query_params["list"][0])
+                async for video_ids in self._extract_video_ids_from_list(
+                    query_params["list"][0]
+                ):
+                    yield video_ids
             elif "v" in query_params and not "list" in query_params:
-                video_ids.append(query_params["v"][0])
-                return video_ids
+                yield [query_params["v"][0]]
         else:
             json_data = await self._yt_query_results(query)
 
+            playlist_id = ""
             try:
                 item_id = json_data["items"][0]["id"]
                 if item_id["kind"].split("#")[-1] == "video":
-                    video_ids.append(item_id["videoId"])
+                    yield [item_id["videoId"]]
                 elif item_id["kind"].split("#")[-1] == "playlist":
                     playlist_id = item_id["playlistId"]
-                    video_ids_from_list = await self._extract_video_ids_from_list(
-                        playlist_id
-                    )
-                    video_ids.extend(video_ids_from_list)
 
             except AttributeError as e:
                 LOGGER.error(
@@ -461,9 +1134,33 @@ class MusicCog(Cog):
                 LOGGER.error(f"Error error while fetching data from search query: {e}")
                 raise e
 
-        return video_ids
+            if playlist_id:
+                async for video_ids in self._extract_video_ids_from_list(playlist_id):
+                    yield video_ids
 
     async def _yt_query_results(self, query: str):
+        cache_key = " ".join(query.lower().split())
+        return await self._searches.run(
+            cache_key, lambda: self._lookup_query_results(query, cache_key)
+        )
+
+    async def _lookup_query_results(self, query: str, cache_key: str):
+        if self._metadata_cache:
+            json_data = await self._metadata_cache.get("search", cache_key)
+            if json_data:
+                return json_data
+
+        json_data = await self._request_query_results(query)
+        if json_data and self._metadata_cache:
+            # Only the IDs of the results are used, the snippets aren't worth storing
+            self._metadata_cache.put(
+                "search",
+                cache_key,
+                {"items": [{"id": item["id"]} for item in json_data.get("items", [])]},
+            )
+        return json_data
+
+    async def _request_query_results(self, query: str):
         query_params = {
             "key": os.environ.get("YT_API_KEY"),
             "part": "snippet",
@@ -472,19 +1169,63 @@ class MusicCog(Cog):
             "maxResults": 5,
         }
 
-        async with request("GET", YT_API_VIDEO_BASE_URL, params=query_params) as resp:
-            if 400 <= resp.status < 600:
-                LOGGER.error(f"[Fetching error]: {resp.text()}")
-                return None
-            return await resp.json()
+        with PLAY_STATS.timer("api.search"):
+            async with self._http_session().get(
+                YT_API_VIDEO_BASE_URL, params=query_params
+            ) as resp:
+                if 400 <= resp.status < 600:
+                    PLAY_STATS.error("api.search")
+                    LOGGER.error(f"[Fetching error]: {await resp.text()}")
+                    return None
+                return await resp.json()
 
     async def _extract_video_ids_from_list(
         self, yt_list_id: str = ""
-    ) -> list[Optional[str]]:
-        """Given a youtube playlistId, returns at most 50 video IDs from that playlist"""
+    ) -> AsyncIterator[List[str]]:
+        """Given a youtube playlistId, yields the video IDs of every page of that playlist"""
 
         if not yt_list_id:
-            return []
+            return
+
+        max_items = env_int("DJGARO_PLAYLIST_MAX_ITEMS", PLAYLIST_MAX_ITEMS)
+        if self._metadata_cache:
+            cached_video_ids = await self._metadata_cache.get("playlist", yt_list_id)
+            if cached_video_ids:
+                cached_video_ids = cached_video_ids[:max_items]
+                for start in range(
+                    0, len(cached_video_ids), YT_API_PLAYLISTITEMS_MAX_RESULTS
+                ):
+                    yield cached_video_ids[
+                        start : start + YT_API_PLAYLISTITEMS_MAX_RESULTS
+                    ]
+                return
+
+        all_video_ids, page_token = [], None
+        while len(all_video_ids) < max_items:
+            with PLAY_STATS.timer("api.playlist_page"):
+                video_ids, page_token = await self._playlist_pages.run(
+                    (yt_list_id, page_token),
+                    lambda: self._fetch_playlist_page(yt_list_id, page_token),
+                )
+            if video_ids is None:
+                # Don't cache a playlist which couldn't be fetched completely
+                all_video_ids = []
+                break
+
+            video_ids = video_ids[: max_items - len(all_video_ids)]
+            all_video_ids.extend(video_ids)
+            if video_ids:
+                yield video_ids
+            if not page_token:
+                break
+
+        if all_video_ids and self._metadata_cache:
+            self._metadata_cache.put("playlist", yt_list_id, all_video_ids)
+
+    async def _fetch_playlist_page(
+        self, yt_list_id: str, page_token: Optional[str] = None
+    ) -> Tuple[Optional[List[str]], Optional[str]]:
+        """Fetches one page of a youtube playlist, returns its video IDs(None on errors) and the token of the next page"""
 
         params = {
             "key": os.environ.get("YT_API_KEY"),
@@ -492,14 +1233,17 @@ class MusicCog(Cog):
             "part": "snippet",
             "maxResults": YT_API_PLAYLISTITEMS_MAX_RESULTS,
         }
+        if page_token:
+            params["pageToken"] = page_token
 
         video_ids = []
-        async with request(
-            "GET", url=YT_API_PLAYLISTITEMS_BASE_URL, params=params
+        async with self._http_session().get(
+            YT_API_PLAYLISTITEMS_BASE_URL, params=params
         ) as resp:
             if 400 <= resp.status < 600:
-                LOGGER.error(f"[Fetching error]: {resp.text()}")
-                return []
+                PLAY_STATS.error("api.playlist_page")
+                LOGGER.error(f"[Fetching error]: {await resp.text()}")
+                return None, None
 
             resp_json = await resp.json()
             try:
@@ -508,92 +1252,156 @@ class MusicCog(Cog):
                     video_ids.append(video_id)
             except AttributeError as exc:
                 LOGGER.error(f"[Error while fetching videos from playlist]: {exc}")
+                return None, None
             except Exception as exc:
                 LOGGER.error(f"[Fetching error]: {exc}")
+                return None, None
 
-        return video_ids
+        return video_ids, resp_json.get("nextPageToken")
 
     async def _fetch_video_metadata(self, yt_video_ids: List[str] = []) -> Dict | None:
-        """Fetches particular data for a given sequence of youtube video IDs and returns the response as a Dict"""
+        """Fetches particular data for a given sequence of at most 50 youtube video IDs and returns the response as a Dict"""
+
+        cached = {}
+        if self._metadata_cache:
+            cached = await self._metadata_cache.get_many("video", yt_video_ids)
+        missing_ids = [video_id for video_id in yt_video_ids if video_id not in cached]
+        fetched = {}
+        if missing_ids:
+            fetched = await self._video_lookups.run_many(
+                missing_ids, self._video_batcher.load_many
+            )
+            if not fetched and not cached:
+                return None
 
+        items = [
+            cached.get(video_id) or fetched.get(video_id) for video_id in yt_video_ids
+        ]
+        return {"items": [item for item in items if item]}
+
+    async def _lookup_video_items(self, yt_video_ids: List[str]) -> Dict[str, Dict]:
+        """Requests the metadata of the videos and returns the fields the playlist needs by video ID"""
+
+        video_metadata_response = await self._request_video_metadata(yt_video_ids)
+        fetched = {}
+        for item in (video_metadata_response or {}).get("items", []):
+            try:
+                fetched[item["id"]] = {
+                    "id": item["id"],
+                    "snippet": {"title": item["snippet"]["title"]},
+                    "contentDetails": {"duration": item["contentDetails"]["duration"]},
+                }
+            except KeyError as e:
+                LOGGER.error(f"Missing field in video metadata: {e}")
+
+        if self._metadata_cache:
+            self._metadata_cache.put_many("video", fetched)
+        return fetched
+
+    async def _request_video_metadata(self, yt_video_ids: List[str]) -> Dict | None:
         query_params = {
             "key": os.environ.get("YT_API_KEY"),
             "part": "snippet,contentDetails",
             "id": ",".join(yt_video_ids),
-            "maxResults": YT_API_PLAYLISTITEMS_MAX_RESULTS,
+            "maxResults": YT_API_VIDEODATA_MAX_IDS,
         }
 
-        async with request(
-            "GET", url=YT_API_VIDEODATA_URL, params=query_params
-        ) as resp:
-            if 400 <= resp.status < 600:
-                LOGGER.error(f"[Fetching error]: {resp.text()}")
-                return None
-            return await resp.json()
+        with PLAY_STATS.timer("api.videos"):
+            async with self._http_session().get(
+                YT_API_VIDEODATA_URL, params=query_params
+            ) as resp:
+                if 400 <= resp.status < 600:
+                    PLAY_STATS.error("api.videos")
+                    LOGGER.error(f"[Fetching error]: {await resp.text()}")
+                    return None
+                return await resp.json()
 
     async def _init_internal_playlist(
-        self, yt_video_ids: List[str | None] = []
+        self, player: GuildPlayer, yt_video_ids: AsyncIterator[List[str]]
     ) -> None:
+        """Appends the videos to the player's queue, in order, as their metadata arrives.
+
+        Metadata of the already known IDs is fetched in chunks of 50 while further
+        pages of IDs are still being fetched, with at most a bounded number of
+        metadata requests in flight.
+        """
 
-        video_metadata_response = await self._fetch_video_metadata(
-            yt_video_ids=yt_video_ids
+        playlist = player.playlist
+        limit = Semaphore(
+            env_int("DJGARO_METADATA_CONCURRENCY", METADATA_FETCH_CONCURRENCY)
         )
+        pending: Deque[Task] = deque()
+
+        async def fetch_chunk(video_ids: List[str]) -> Dict | None:
+            async with limit:
+                return await self._fetch_video_metadata(yt_video_ids=video_ids)
+
+        async def append_chunk(task: Task) -> None:
+            video_metadata_response = await task
+            # A new '!play' replaces the queue, results for the old one are dropped
+            if video_metadata_response and playlist is player.playlist:
+                await self._append_playlist_items(playlist, video_metadata_response)
+                player.notify_items_added()
+                player.prefetcher.schedule()
+
+        try:
+            async for video_ids in yt_video_ids:
+                for start in range(0, len(video_ids), YT_API_VIDEODATA_MAX_IDS):
+                    chunk = video_ids[start : start + YT_API_VIDEODATA_MAX_IDS]
+                    pending.append(create_task(fetch_chunk(chunk)))
+
+                while pending and pending[0].done():
+                    await append_chunk(pending.popleft())
+                if playlist is not player.playlist:
+                    break
+
+            while pending:
+                await append_chunk(pending.popleft())
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _append_playlist_items(
+        self, playlist: SongQueue, video_metadata_response: Dict
+    ) -> None:
 
-        if video_metadata_response:
-            for item in video_metadata_response["items"]:
-                playlist_item = PlaylistItem()
-                try:
-                    playlist_item.video_id = item["id"]
-                    playlist_item.yt_url = YT_WEB_VIDEO_BASE_URL + item["id"]
-                    playlist_item.title = item["snippet"]["title"]
-                    playlist_item.duration = await self._format_yt_duration(
-                        parse_duration(item["contentDetails"]["duration"])
-                    )
-                    self.playlist.append(playlist_item)
-                except AttributeError as e:
-                    LOGGER.error(f"Attribute error while fetching video metadata: {e}")
-                except Exception as e:
-                    LOGGER.error(f"Error while fetching video metadata: {e}")
-                    raise
-
-    def _extract_raw_url(self, video_url: str) -> str:
-        """Extracts the raw audio source URL with opus encoding given the youtube video URL"""
-
-        LOGGER.info(f"Downloading raw url for : {video_url}")
-        raw_url = ""
-        with self._dlp as info_extractor:
+        for item in video_metadata_response["items"]:
+            playlist_item = PlaylistItem()
             try:
-                info = info_extractor.extract_info(video_url, download=False)
-                format_list = info.get("formats", None)
-                if format_list:
-                    for item in format_list:
-                        acodec = item.get("acodec")
-                        url = item.get("url")
-                        if (
-                            acodec in self.ACODECS
-                            and url != "none"
-                            and url.strip() != ""
-                        ):
-                            raw_url = url
-                            break
-            except Exception as exc:
-                # yt_dlp logs the error so no need to log anything here
-                # LOGGER.error(f'Error while extracting video info: {exc}')
-                pass
-
-        return raw_url
-
-    async def _format_yt_duration(self, duration: Any) -> str:
-        duration_string = ""
-        time_dur = duration.time
-        if time_dur.hours:
-            duration_string += f"{time_dur.hours}h "
-        if time_dur.minutes:
-            duration_string += f"{time_dur.minutes}m "
-        if time_dur.seconds:
-            duration_string += f"{time_dur.seconds}s"
-
-        return duration_string
+                playlist_item.video_id = item["id"]
+                playlist_item.title = item["snippet"]["title"]
+                playlist_item.duration = self._yt_duration_seconds(
+                    item["contentDetails"]["duration"]
+                )
+                playlist.append(playlist_item)
+            except AttributeError as e:
+                LOGGER.error(f"Attribute error while fetching video metadata: {e}")
+            except Exception as e:
+                LOGGER.error(f"Error while fetching video metadata: {e}")
+                raise
+
+    def _yt_duration_seconds(self, iso_duration: str) -> int:
+        # The API's durations look like 'PT1H2M3S' or 'P1DT2H', a regex parses them far
+        # faster than isoduration, which is only used for anything unusual
+        match = YT_DURATION_PATTERN.fullmatch(iso_duration)
+        if match:
+            weeks, days, hours, minutes, seconds = (
+                float(part or 0) for part in match.groups()
+            )
+            return int(
+                ((weeks * 7 + days) * 24 + hours) * 3600 + minutes * 60 + seconds
+            )
+
+        # Imported on first use, it isn't needed to start the bot
+        from isoduration import parse_duration
+
+        duration = parse_duration(iso_duration)
+        date_dur, time_dur = duration.date, duration.time
+        return int(
+            ((date_dur.weeks * 7 + date_dur.days) * 24 + time_dur.hours) * 3600
+            + time_dur.minutes * 60
+            + time_dur.seconds
+        )
 
 
 async def setup(bot: Bot):
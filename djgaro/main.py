@@ -1,3 +1,4 @@
+from asyncio import Task, create_task, get_running_loop
 from discord import Intents
 from discord.ext import commands
 from dotenv import load_dotenv
@@ -5,6 +6,23 @@ import logging.config
 import os
 from pathlib import Path
 from json import loads as json_loads
+import signal
+from time import perf_counter
+from typing import List, Optional
+
+from djgaro.utils.config import env_bool, env_float, env_int, env_str
+from djgaro.utils.constants import LOG_QUEUE_SIZE, METRICS_HOST
+from djgaro.utils.logs import (
+    RateLimitFilter,
+    SamplingFilter,
+    move_handlers_to_thread,
+)
+from djgaro.utils.metrics import MetricsServer, cog_metrics, latency_metrics
+from djgaro.utils.sharding import (
+    ShardSupervisor,
+    assign_shards,
+    recommended_shard_count,
+)
 
 
 load_dotenv()
@@ -17,10 +35,17 @@ def AllowOnlyWarrnings(record: logging.LogRecord) -> bool:
     return record.levelno == logging.WARNING
 
 
-def setup_logger():
+def setup_logger(worker_index: Optional[int] = None):
     config_file_path = PROJECT_DIR / "logger_config.json"
     with open(config_file_path, "r") as config:
         dict_config = json_loads(config.read())
+        if worker_index is not None:
+            # A rotating log file can't be shared between processes, every worker gets its own
+            file_handler = dict_config["handlers"]["file"]
+            name, extension = os.path.splitext(file_handler["filename"])
+            file_handler["filename"] = f"{name}.worker{worker_index}{extension}"
+        if env_str("DJGARO_LOG_FORMAT", "text").lower() == "json":
+            dict_config["handlers"]["file"]["formatter"] = "json"
         logging.config.dictConfig(dict_config)
         LOGGER = logging.getLogger("dj_garo")
 
@@ -28,23 +53,99 @@ def setup_logger():
             if handler.name == "stdout":
                 handler.addFilter(AllowOnlyWarrnings)
                 break
-        return LOGGER
 
+        # Warnings and errors are never sampled or rate limited
+        sample_rate = env_float("DJGARO_LOG_SAMPLE_RATE", 1.0)
+        if sample_rate < 1:
+            LOGGER.addFilter(SamplingFilter(sample_rate))
+        rate_limit = env_float("DJGARO_LOG_RATE_LIMIT", 0)
+        if rate_limit > 0:
+            LOGGER.addFilter(RateLimitFilter(rate_limit))
+        if env_bool("DJGARO_LOG_IN_BACKGROUND", True):
+            move_handlers_to_thread(
+                LOGGER, env_int("DJGARO_LOG_QUEUE_SIZE", LOG_QUEUE_SIZE)
+            )
+        return LOGGER
 
-def main() -> int:
-    LOGGER = setup_logger()
 
+def run_bot(
+    LOGGER: logging.Logger,
+    *,
+    sharded: bool = False,
+    shard_ids: Optional[List[int]] = None,
+    shard_count: Optional[int] = None,
+    metrics_port: int = 0,
+    worker_index: Optional[int] = None,
+    worker_count: int = 1,
+) -> int:
     intents = Intents().default()
     intents.messages = True
     intents.message_content = True
 
-    bot = commands.Bot(command_prefix="!", intents=intents)
+    if sharded:
+        bot = commands.AutoShardedBot(
+            command_prefix="!",
+            intents=intents,
+            shard_ids=shard_ids,
+            shard_count=shard_count,
+        )
+    else:
+        bot = commands.Bot(command_prefix="!", intents=intents)
+    # Files the cog keeps on disk are separate for every worker process
+    bot.worker_index, bot.worker_count = worker_index, worker_count
+    bot.metrics_server = None
+
+    started = perf_counter()
+    closing: Optional[Task] = None
+
+    def stop() -> None:
+        nonlocal closing
+        if closing is None:
+            LOGGER.info(f"Stopping the bot...")
+            closing = create_task(bot.close())
+
+    async def setup_hook():
+        # Runs once before connecting, unlike on_ready which fires again after every reconnect
+        # systemd, docker and the shard supervisor stop the bot with SIGTERM, which closes it like
+        # a Ctrl-C does: the players are saved, voice connections closed and the logs flushed
+        try:
+            get_running_loop().add_signal_handler(signal.SIGTERM, stop)
+        except NotImplementedError:
+            # Windows has no signal handlers in asyncio
+            pass
+        LOGGER.info("Loading Music cog...")
+        await bot.load_extension("djgaro.cogs.music")
+        LOGGER.info(
+            f"Music cog loaded successfully in {perf_counter() - started:.2f}s!"
+        )
+        if metrics_port > 0:
+            metrics_server = MetricsServer(
+                [latency_metrics, lambda: cog_metrics(bot)],
+                env_str("DJGARO_METRICS_HOST", METRICS_HOST),
+                metrics_port,
+            )
+            try:
+                await metrics_server.start()
+                bot.metrics_server = metrics_server
+            except OSError as exc:
+                LOGGER.error(f"[Metrics] - Starting the metrics server failed: {exc}")
+
+    bot.setup_hook = setup_hook
+
+    close_bot = bot.close
+
+    async def close():
+        # The metrics server isn't part of the bot, it'd keep its port until the process exits
+        if bot.metrics_server:
+            await bot.metrics_server.stop()
+            bot.metrics_server = None
+        await close_bot()
+
+    bot.close = close
 
     @bot.event
     async def on_ready():
-        LOGGER.info("Loading Music cog...")
-        await bot.load_extension("djgaro.cogs.music")
-        LOGGER.info(f"Music cog loaded successfully!")
+        LOGGER.info(f"Bot ready {perf_counter() - started:.2f}s after starting")
 
     @bot.command()
     async def hello(ctx: commands.Context):
@@ -58,5 +159,52 @@ def main() -> int:
     return 0
 
 
+def run_worker(
+    worker_index: int, shard_ids: List[int], shard_count: int, worker_count: int
+) -> None:
+    """Entry point of a worker process started by the shard supervisor"""
+
+    # A Ctrl-C reaches every process of the terminal, the supervisor stops the workers with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    LOGGER = setup_logger(worker_index)
+    LOGGER.info(
+        f"[Worker {worker_index}] - Running shards {shard_ids} of {shard_count}"
+    )
+    # Every worker serves its own metrics on the next port after the previous worker's
+    metrics_port = env_int("DJGARO_METRICS_PORT", 0)
+    run_bot(
+        LOGGER,
+        sharded=True,
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+        metrics_port=metrics_port + worker_index if metrics_port > 0 else 0,
+        worker_index=worker_index,
+        worker_count=worker_count,
+    )
+
+
+def main() -> int:
+    LOGGER = setup_logger()
+
+    processes = env_int("DJGARO_PROCESSES", 1)
+    assignment = env_str("DJGARO_SHARD_ASSIGNMENT", "")
+    shard_count = env_int("DJGARO_SHARD_COUNT", 0)
+    if processes <= 1 and not assignment:
+        return run_bot(
+            LOGGER,
+            sharded=env_bool("DJGARO_SHARDED", False) or shard_count > 0,
+            shard_count=shard_count or None,
+            metrics_port=env_int("DJGARO_METRICS_PORT", 0),
+        )
+
+    if shard_count <= 0:
+        shard_count = recommended_shard_count(TOKEN)
+    shard_groups = assign_shards(shard_count, processes, assignment)
+    LOGGER.info(
+        f"[Supervisor] - Running {shard_count} shards in {len(shard_groups)} processes"
+    )
+    return ShardSupervisor(run_worker, shard_groups, shard_count).run()
+
+
 if __name__ == "__main__":
     exit(main())
@@ -0,0 +1,234 @@
+from collections import OrderedDict
+import os
+import shlex
+import subprocess
+import threading
+from typing import Any, Optional, Set
+from uuid import uuid4
+from logging import getLogger
+
+from djgaro.utils.config import env_int, env_str
+from djgaro.utils.constants import AUDIO_CACHE_PATH, AUDIO_CACHE_SIZE_MB
+from djgaro.utils.ffmpeg import GovernedOpusAudio
+
+
+LOGGER = getLogger("dj_garo")
+
+_SUFFIX = ".opus"
+_PART_SUFFIX = ".part"
+# Seconds ffmpeg gets to write the trailer of the cached file after discord read the last packet
+_FINISH_TIMEOUT = 5
+
+
+class AudioCache(object):
+    """Size bounded directory of opus files of songs which were played to the end, keyed by youtube video ID.
+
+    Files are written under a temporary name and renamed once ffmpeg finished them, so a
+    partially written file is never played. The least recently played files are deleted
+    once the directory holds more than `max_bytes`. The index is kept in memory and is
+    shared between the event loop and the audio player threads which finish the writes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # video ID -> file size, least recently played first
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._writing: Set[str] = set()
+        self._size = 0
+
+    def load(self) -> None:
+        """Indexes the files left by previous runs and removes unfinished ones, blocks on disk IO"""
+
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_PART_SUFFIX):
+                self._remove(entry.path)
+            elif entry.name.endswith(_SUFFIX) and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[: -len(_SUFFIX)], stat.st_size))
+
+        with self._lock:
+            for _, video_id, size in sorted(files):
+                self._entries[video_id] = size
+                self._size += size
+            self._evict()
+        LOGGER.info(
+            f"[Audio Cache] - {len(self._entries)} songs, {self._size / 2**20:.1f}MiB in {self.directory}"
+        )
+
+    def lookup(self, video_id: str) -> Optional[str]:
+        """Returns the path of the cached song and marks it as recently played, None if it isn't cached"""
+
+        with self._lock:
+            if video_id not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(video_id)
+            self.hits += 1
+
+        path = self.path(video_id)
+        try:
+            # The modification time orders the files by last play after a restart
+            os.utime(path)
+        except OSError:
+            self.discard(video_id)
+            return None
+        return path
+
+    def begin_write(self, video_id: str) -> Optional[str]:
+        """Reserves a temporary file for the song, None if it's cached or already being written"""
+
+        with self._lock:
+            if video_id in self._entries or video_id in self._writing:
+                return None
+            self._writing.add(video_id)
+        return os.path.join(self.directory, f"{video_id}.{uuid4().hex}{_PART_SUFFIX}")
+
+    def end_write(self, video_id: str, part_path: str, completed: bool) -> None:
+        """Publishes a completely written file under its final name, deletes an incomplete one"""
+
+        try:
+            size = os.path.getsize(part_path) if completed else 0
+            if size:
+                os.replace(part_path, self.path(video_id))
+            else:
+                self._remove(part_path)
+        except OSError as exc:
+            LOGGER.error(f"[Audio Cache] - Couldn't store {video_id}: {exc}")
+            self._remove(part_path)
+            size = 0
+
+        with self._lock:
+            self._writing.discard(video_id)
+            if size:
+                self._entries[video_id] = size
+                self._size += size
+                self._evict()
+
+    def discard(self, video_id: str) -> None:
+        with self._lock:
+            size = self._entries.pop(video_id, None)
+            if size is not None:
+                self._size -= size
+        if size is not None:
+            self._remove(self.path(video_id))
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def is_writing(self, video_id: str) -> bool:
+        return video_id in self._writing
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self) -> None:
+        # Called with the lock held, a file that is still being played stays readable on posix systems
+        while self._size > self.max_bytes and self._entries:
+            video_id, size = self._entries.popitem(last=False)
+            self._size -= size
+            self._remove(self.path(video_id))
+
+    def path(self, video_id: str) -> str:
+        return os.path.join(self.directory, f"{video_id}{_SUFFIX}")
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            LOGGER.warning(f"[Audio Cache] - Couldn't remove {path}: {exc}")
+
+
+class CachingOpusAudio(GovernedOpusAudio):
+    """Passes an opus stream through to discord and lets the same ffmpeg process write a copy into the audio cache.
+
+    The copy is kept only if discord read the stream to its end and ffmpeg exited cleanly,
+    songs which were skipped, stopped or broke off are deleted. It's stored as soon as the
+    last packet was read, discord calls `after` before `cleanup` and the next play of the
+    song(e.g. with REPEAT_ONE) has to find it in the cache already.
+    """
+
+    def __init__(
+        self, source: str, *, cache: AudioCache, video_id: str, **kwargs: Any
+    ) -> None:
+        self._cache = cache
+        self._video_id = video_id
+        self._part_path = cache.begin_write(video_id)
+
+        if self._part_path:
+            # The options are placed in front of discord's pipe:1 output, so the cached file becomes
+            # the first output(with discord's output options) and the pipe gets its own options
+            kwargs["options"] = shlex.join(
+                [
+                    self._part_path,
+                    "-map_metadata",
+                    "-1",
+                    "-f",
+                    "opus",
+                    "-c:a",
+                    "copy",
+                ]
+            )
+        try:
+            super().__init__(source, codec="copy", **kwargs)
+        except Exception:
+            self._finish(completed=False)
+            raise
+
+    def read(self) -> bytes:
+        packet = super().read()
+        if not packet and self._part_path:
+            # Called from the audio player thread, which may block until ffmpeg wrote the trailer
+            self._finish(self._ffmpeg_succeeded())
+        return packet
+
+    def cleanup(self) -> None:
+        super().cleanup()
+        # Anything that wasn't finished in `read` was not played to the end
+        self._finish(completed=False)
+
+    def _ffmpeg_succeeded(self) -> bool:
+        process = getattr(self, "_process", None)
+        if not isinstance(process, subprocess.Popen):
+            return False
+        try:
+            return process.wait(timeout=_FINISH_TIMEOUT) == 0
+        except subprocess.TimeoutExpired:
+            return False
+
+    def _finish(self, completed: bool) -> None:
+        part_path, self._part_path = self._part_path, None
+        if part_path:
+            self._cache.end_write(self._video_id, part_path, completed)
+
+
+def create_audio_cache(
+    worker_index: Optional[int] = None, worker_count: int = 1
+) -> Optional[AudioCache]:
+    """Creates the cache configured by the DJGARO_AUDIO_CACHE_* settings, None if it's disabled.
+
+    Worker processes never share a cache, every worker gets its own subdirectory and an
+    equal share of the size budget.
+    """
+
+    max_megabytes = env_int("DJGARO_AUDIO_CACHE_SIZE", AUDIO_CACHE_SIZE_MB)
+    if max_megabytes <= 0:
+        return None
+
+    directory = env_str("DJGARO_AUDIO_CACHE_PATH", AUDIO_CACHE_PATH)
+    max_bytes = max_megabytes * 2**20
+    if worker_index is not None:
+        directory = os.path.join(directory, f"worker{worker_index}")
+        max_bytes //= max(worker_count, 1)
+    return AudioCache(directory, max_bytes)
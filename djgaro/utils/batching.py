@@ -0,0 +1,114 @@
+from asyncio import (
+    CancelledError,
+    Future,
+    Task,
+    TimerHandle,
+    create_task,
+    gather,
+    get_running_loop,
+    shield,
+)
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    List,
+    Optional,
+    Set,
+    TypeVar,
+)
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class MicroBatcher(Generic[K, V]):
+    """Collects the keys concurrent callers look up and looks them up together in one call.
+
+    A batch is sent `window` seconds after its first key arrived or as soon as it holds
+    `max_batch` keys, whatever comes first. Every caller gets the values of its own keys,
+    or the error of the batch. Cancelled callers stop waiting, the batch is still sent.
+    """
+
+    def __init__(
+        self,
+        function: Callable[[List[K]], Awaitable[Dict[K, V]]],
+        window: float,
+        max_batch: int,
+    ) -> None:
+        self._function = function
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[K, Future] = {}
+        self._timer: Optional[TimerHandle] = None
+        self._running: Set[Task] = set()
+        self.batches = 0
+        self.keys = 0
+
+    async def load_many(self, keys: List[K]) -> Dict[K, V]:
+        """Returns the found values by key, keys without a value are missing from the result"""
+
+        loop = get_running_loop()
+        futures = {}
+        for key in dict.fromkeys(keys):
+            future = self._pending.get(key)
+            if future is None:
+                future = loop.create_future()
+                self._pending[key] = future
+            futures[key] = future
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        values = await gather(*(shield(future) for future in futures.values()))
+        return {key: value for key, value in zip(futures, values) if value is not None}
+
+    def cancel(self) -> None:
+        """Cancels the batches which are waiting or running"""
+
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        for future in self._pending.values():
+            future.cancel()
+        self._pending = {}
+        for task in list(self._running):
+            task.cancel()
+
+    def _flush(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return None
+
+        batch, self._pending = self._pending, {}
+        self.batches += 1
+        self.keys += len(batch)
+        task = create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: Dict[K, Future]) -> None:
+        try:
+            values = await self._function(list(batch))
+        except CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as exc:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(exc)
+                    # Marks the error as retrieved even if every caller went away
+                    future.exception()
+            return None
+
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(values.get(key))
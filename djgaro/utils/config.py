@@ -0,0 +1,26 @@
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    """Reads an integer setting from the environment, falling back to `default`"""
+    value = os.environ.get(name, "").strip()
+    return int(value) if value else default
+
+
+def env_float(name: str, default: float) -> float:
+    """Reads a float setting from the environment, falling back to `default`"""
+    value = os.environ.get(name, "").strip()
+    return float(value) if value else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Reads a boolean setting('1', 'true', 'yes', 'on') from the environment"""
+    value = os.environ.get(name, "").strip().lower()
+    if not value:
+        return default
+    return value in ("1", "true", "yes", "on")
+
+
+def env_str(name: str, default: str) -> str:
+    """Reads a string setting from the environment, falling back to `default`"""
+    return os.environ.get(name, "").strip() or default
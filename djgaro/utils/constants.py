@@ -2,5 +2,93 @@ YT_API_PLAYLISTITEMS_MAX_RESULTS = 50
 YT_API_PLAYLISTITEMS_BASE_URL = 'https://www.googleapis.com/youtube/v3/playlistItems?'
 YT_API_VIDEO_BASE_URL = 'https://www.googleapis.com/youtube/v3/search?'
 YT_API_VIDEODATA_URL = 'https://www.googleapis.com/youtube/v3/videos?'
+# The 'videos' endpoint accepts at most 50 comma separated IDs per request
+YT_API_VIDEODATA_MAX_IDS = 50
 
-YT_WEB_VIDEO_BASE_URL = 'https://www.youtube.com/watch?v='
\ No newline at end of file
+YT_WEB_VIDEO_BASE_URL = 'https://www.youtube.com/watch?v='
+
+STREAM_URL_CACHE_SIZE = 512
+# Used when a resolved stream URL carries no 'expire' query parameter
+STREAM_URL_DEFAULT_TTL = 6 * 60 * 60
+# Cached URLs expiring sooner than this are refreshed in the background
+STREAM_URL_REFRESH_MARGIN = 30 * 60
+# Cached URLs expiring sooner than this are not handed out at all
+STREAM_URL_MIN_VALIDITY = 5 * 60
+
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 20
+HTTP_KEEPALIVE_TIMEOUT = 60
+HTTP_DNS_CACHE_TTL = 300
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_TOTAL_TIMEOUT = 15
+
+# YouTube playlists are capped at 5000 videos
+PLAYLIST_MAX_ITEMS = 5000
+METADATA_FETCH_CONCURRENCY = 4
+
+# Number of upcoming songs whose stream URLs are resolved ahead of time
+PREFETCH_WINDOW = 3
+# Maximum number of background stream URL extractions running at once
+EXTRACTION_CONCURRENCY = 4
+
+# 'thread' runs yt_dlp in the bot's process, 'process' in a pool of worker processes
+EXTRACTOR_MODE = "thread"
+EXTRACTION_TIMEOUT = 30
+# 'fast' resolves only the audio stream with the youtube extractor, 'default' runs yt_dlp with its default options
+EXTRACTION_PROFILE = "fast"
+
+# Audio codecs discord can play without re-encoding, streams in these codecs skip ffprobe
+PASSTHROUGH_ACODECS = ["opus"]
+
+# SQLite file of the persistent youtube API cache, relative to the working directory like the log file
+METADATA_CACHE_PATH = "dj_garo_cache.db"
+METADATA_CACHE_SIZE = 100000
+METADATA_CACHE_FLUSH_DELAY = 0.5
+METADATA_CACHE_FLUSH_BATCH = 200
+VIDEO_METADATA_TTL = 7 * 24 * 60 * 60
+PLAYLIST_ITEMS_TTL = 60 * 60
+SEARCH_RESULTS_TTL = 24 * 60 * 60
+
+LOOP_WATCHDOG_INTERVAL = 0.5
+# The event loop being blocked for longer than this(seconds) is reported as a stall
+LOOP_STALL_THRESHOLD = 1.0
+
+# Directory and size budget(MiB) of the local copies of played songs, 0 disables the audio cache
+AUDIO_CACHE_PATH = "dj_garo_audio"
+AUDIO_CACHE_SIZE_MB = 0
+
+DISCORD_GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+# Discord allows one gateway login(identify) per 5 seconds
+SHARD_IDENTIFY_INTERVAL = 5
+# Seconds before a crashed worker process is restarted, doubled while it keeps crashing
+WORKER_RESTART_DELAY = 1
+WORKER_MAX_RESTART_DELAY = 60
+# Seconds the workers get to close their bots(e.g. to save the players) before they're killed
+WORKER_STOP_TIMEOUT = 30
+
+# Log records waiting for the background logging thread, records beyond that are dropped
+LOG_QUEUE_SIZE = 10000
+
+# Seconds for which video metadata lookups of all guilds are collected into one API request
+METADATA_BATCH_WINDOW = 0.02
+
+# Seconds before the end of a song at which the audio stream of the next song is opened, 0 disables it
+PRELOAD_SECONDS = 5
+
+# Seconds the bot stays in a voice channel it was left alone in before disconnecting
+IDLE_DISCONNECT_DELAY = 60
+
+# Address the metrics endpoint listens on, only local scrapers can reach it by default
+METRICS_HOST = "127.0.0.1"
+
+# Concurrent ffmpeg transcodes per CPU core, passed through opus streams aren't limited
+TRANSCODES_PER_CPU = 2
+# Seconds a transcode waits for a free slot before it starts with degraded settings
+TRANSCODE_QUEUE_TIMEOUT = 5
+# Bitrate(kbps) of degraded transcodes
+DEGRADED_TRANSCODE_BITRATE = 64
+
+# File the players are saved to on unload and restored from on load, relative to the working directory
+SNAPSHOT_PATH = "dj_garo_snapshot.json"
+# Seconds after which a saved snapshot is too old to be restored
+SNAPSHOT_MAX_AGE = 600
@@ -0,0 +1,350 @@
+from abc import ABC, abstractmethod
+from asyncio import (
+    CancelledError,
+    TimeoutError as AsyncTimeoutError,
+    gather,
+    to_thread,
+    wait_for,
+    wrap_future,
+)
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+import os
+import sys
+import threading
+from json import loads as json_loads
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+from attr import dataclass
+from logging import getLogger
+
+from djgaro.utils.config import env_float, env_int, env_str
+from djgaro.utils.constants import (
+    EXTRACTION_PROFILE,
+    EXTRACTION_TIMEOUT,
+    EXTRACTOR_MODE,
+)
+
+if TYPE_CHECKING:
+    from yt_dlp import YoutubeDL
+
+
+LOGGER = getLogger("dj_garo")
+
+ACODECS = ["opus"]
+
+# yt_dlp selects the audio stream itself, opus first since it's played without re-encoding.
+# Manifests(DASH/HLS), comments and playlists are never looked at.
+FAST_DLP_OPTIONS: Dict[str, Any] = {
+    "format": "bestaudio[acodec=opus]/bestaudio",
+    "noplaylist": True,
+    "getcomments": False,
+    "check_formats": False,
+    "youtube_include_dash_manifest": False,
+    "youtube_include_hls_manifest": False,
+    "extractor_args": {"youtube": {"skip": ["dash", "hls"]}},
+    "quiet": True,
+    "no_warnings": True,
+}
+
+# Profile -> (yt_dlp options, key of the only extractor used or None to let yt_dlp find it)
+EXTRACTION_PROFILES: Dict[str, Tuple[Dict[str, Any], Optional[str]]] = {
+    "default": ({}, None),
+    "fast": (FAST_DLP_OPTIONS, "Youtube"),
+}
+
+
+@dataclass
+class StreamInfo(object):
+    """A raw audio stream URL with the codec and bitrate(kbit/s) yt_dlp reported for it"""
+
+    url: str = ""
+    acodec: str = ""
+    abr: float = 0.0
+
+
+def create_info_extractor(dlp_options: Dict[str, Any]) -> "YoutubeDL":
+    """Creates a YoutubeDL instance with its youtube extractor loaded.
+
+    yt_dlp is imported on first use, importing it and loading the extractor takes a few
+    hundred milliseconds which are logged the first time.
+    """
+
+    started = perf_counter()
+    first_import = "yt_dlp" not in sys.modules
+    from yt_dlp import YoutubeDL
+
+    imported = perf_counter()
+    info_extractor = YoutubeDL(dlp_options)
+    info_extractor.get_info_extractor("Youtube")
+    if first_import:
+        LOGGER.info(
+            f"[Extraction] - Imported yt_dlp in {imported - started:.3f}s, "
+            f"initialized it in {perf_counter() - imported:.3f}s"
+        )
+    return info_extractor
+
+
+def extract_stream_info(
+    info_extractor: "YoutubeDL",
+    video_url: str,
+    acodecs: List[str] = ACODECS,
+    ie_key: Optional[str] = None,
+) -> StreamInfo:
+    """Extracts the raw audio source URL with opus encoding given the youtube video URL.
+
+    With a 'format' option yt_dlp has already selected the stream, otherwise the first opus
+    stream of the format list is picked. An `ie_key` skips yt_dlp's search for the extractor.
+    """
+
+    LOGGER.info(f"Downloading raw url for : {video_url}")
+    stream_info = StreamInfo()
+    try:
+        info = info_extractor.extract_info(video_url, download=False, ie_key=ie_key)
+        url = info.get("url") or ""
+        if url and info.get("vcodec") in (None, "none"):
+            # A single audio only format selected by yt_dlp
+            stream_info = StreamInfo(
+                url, info.get("acodec") or "", info.get("abr") or 0.0
+            )
+        else:
+            format_list = info.get("formats", None)
+            if format_list:
+                for item in format_list:
+                    acodec = item.get("acodec")
+                    url = item.get("url") or ""
+                    if acodec in acodecs and url != "none" and url.strip() != "":
+                        stream_info = StreamInfo(url, acodec, item.get("abr") or 0.0)
+                        break
+    except Exception:
+        # yt_dlp logs the error so no need to log anything here
+        pass
+
+    return stream_info
+
+
+def extraction_options(
+    profile: str, overrides: Optional[Dict[str, Any]] = None
+) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Returns the yt_dlp options and extractor key of a profile, `overrides` replace single options"""
+
+    if profile not in EXTRACTION_PROFILES:
+        LOGGER.warning(
+            f"Unknown extraction profile '{profile}', falling back to 'default'"
+        )
+        profile = "default"
+    dlp_options, ie_key = EXTRACTION_PROFILES[profile]
+    return {**dlp_options, **(overrides or {})}, ie_key
+
+
+class Extractor(ABC):
+    """Resolves youtube video URLs into raw audio stream URLs off the event loop"""
+
+    def __init__(
+        self,
+        dlp_options: Optional[Dict[str, Any]] = None,
+        timeout: float = EXTRACTION_TIMEOUT,
+        ie_key: Optional[str] = None,
+    ) -> None:
+        self.dlp_options = dlp_options or {}
+        self.timeout = timeout
+        self.ie_key = ie_key
+
+    async def warm_up(self) -> None:
+        """Imports yt_dlp and prepares the workers ahead of the first extraction"""
+
+    async def extract(self, video_url: str) -> StreamInfo:
+        """Returns the raw audio stream, its URL is empty if it can't be extracted in time"""
+
+        try:
+            return await wait_for(self._extract(video_url), timeout=self.timeout)
+        except AsyncTimeoutError:
+            LOGGER.error(
+                f"[Extraction] - Timed out after {self.timeout}s while extracting {video_url}"
+            )
+            self._timed_out()
+            return StreamInfo()
+
+    def _timed_out(self) -> None:
+        """Called after an extraction timed out"""
+
+    @abstractmethod
+    async def _extract(self, video_url: str) -> StreamInfo:
+        """Runs the extraction itself, `extract` applies the timeout"""
+
+    def shutdown(self) -> None:
+        pass
+
+
+class ThreadExtractor(Extractor):
+    """Runs the extraction in the default thread pool, every thread keeps its own YoutubeDL instance.
+
+    A timed out or cancelled extraction keeps running in its thread until yt_dlp returns.
+    """
+
+    def __init__(
+        self,
+        dlp_options: Optional[Dict[str, Any]] = None,
+        timeout: float = EXTRACTION_TIMEOUT,
+        ie_key: Optional[str] = None,
+    ) -> None:
+        super().__init__(dlp_options, timeout, ie_key)
+        self._local = threading.local()
+
+    async def warm_up(self) -> None:
+        await to_thread(self._info_extractor)
+
+    async def _extract(self, video_url: str) -> StreamInfo:
+        return await to_thread(self._extract_in_thread, video_url)
+
+    def _extract_in_thread(self, video_url: str) -> StreamInfo:
+        return extract_stream_info(
+            self._info_extractor(), video_url, ie_key=self.ie_key
+        )
+
+    def _info_extractor(self) -> "YoutubeDL":
+        info_extractor = getattr(self._local, "info_extractor", None)
+        if info_extractor is None:
+            info_extractor = create_info_extractor(self.dlp_options)
+            self._local.info_extractor = info_extractor
+        return info_extractor
+
+
+# The YoutubeDL instance of a ProcessExtractor worker process, created once by its initializer
+_WORKER_INFO_EXTRACTOR: Optional["YoutubeDL"] = None
+
+
+def _init_worker(dlp_options: Dict[str, Any]) -> None:
+    global _WORKER_INFO_EXTRACTOR
+    _WORKER_INFO_EXTRACTOR = create_info_extractor(dlp_options)
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def _worker_extract(video_url: str, ie_key: Optional[str] = None) -> StreamInfo:
+    return extract_stream_info(_WORKER_INFO_EXTRACTOR, video_url, ie_key=ie_key)
+
+
+class ProcessExtractor(Extractor):
+    """Runs the extraction in a pool of worker processes, each with a pre-initialized YoutubeDL instance.
+
+    yt_dlp's extraction is CPU bound python code, a process pool lets concurrent
+    extractions use every core instead of contending for the GIL of the bot's process.
+    Cancelled jobs which haven't started yet are dropped, jobs already running in a
+    worker run to completion and their result is discarded. A timed out job may never
+    complete(e.g. a hung connection), once such abandoned jobs occupy every worker the
+    pool is replaced by a new one and its workers are killed.
+    """
+
+    def __init__(
+        self,
+        dlp_options: Optional[Dict[str, Any]] = None,
+        timeout: float = EXTRACTION_TIMEOUT,
+        workers: Optional[int] = None,
+        ie_key: Optional[str] = None,
+    ) -> None:
+        super().__init__(dlp_options, timeout, ie_key)
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Cancelled or timed out jobs which are still running in a worker
+        self._abandoned: Set[Future] = set()
+
+    async def warm_up(self) -> None:
+        pool = self._get_pool()
+        # Worker processes are spawned on demand, submitting one job per worker spawns them all
+        try:
+            await gather(
+                *(wrap_future(pool.submit(_worker_ready)) for _ in range(self.workers))
+            )
+        except BrokenProcessPool:
+            LOGGER.error("[Extraction] - Worker pool broke while starting")
+            self.shutdown()
+
+    async def _extract(self, video_url: str) -> StreamInfo:
+        while True:
+            pool = self._get_pool()
+            job = pool.submit(_worker_extract, video_url, self.ie_key)
+            try:
+                return await wrap_future(job)
+            except BrokenProcessPool:
+                if self._pool is not None and pool is not self._pool:
+                    # The pool was replaced in the meantime, run this one on the new pool
+                    continue
+                # A worker died abruptly, the next extraction starts with a fresh pool
+                LOGGER.error(
+                    f"[Extraction] - Worker pool broke while extracting {video_url}"
+                )
+                self.shutdown()
+                return StreamInfo()
+            except CancelledError:
+                if job.running() and pool is self._pool:
+                    self._abandoned.add(job)
+                    job.add_done_callback(self._abandoned.discard)
+                raise
+
+    def _timed_out(self) -> None:
+        if self._pool is None or len(self._abandoned) < self.workers:
+            return None
+
+        LOGGER.warning(
+            f"[Extraction] - All {self.workers} workers are busy with abandoned extractions, replacing the worker pool"
+        )
+        pool, self._pool = self._pool, None
+        self._get_pool()
+        self._abandoned.clear()
+        self._kill_workers(pool)
+
+    def _kill_workers(self, pool: ProcessPoolExecutor) -> None:
+        # A running job can't be cancelled and ProcessPoolExecutor can't stop its workers,
+        # they are killed, jobs still queued in the pool fail with BrokenProcessPool
+        for process in list((pool._processes or {}).values()):
+            process.kill()
+        pool.shutdown(wait=False)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.dlp_options,),
+            )
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            if self._abandoned:
+                # Workers stuck in abandoned jobs would keep the bot from exiting
+                self._kill_workers(pool)
+            else:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._abandoned.clear()
+
+
+def create_extractor(dlp_options: Optional[Dict[str, Any]] = None) -> Extractor:
+    """Creates the extraction backend selected by the DJGARO_EXTRACTOR setting('thread' or 'process').
+
+    Without explicit `dlp_options` yt_dlp is configured by the DJGARO_EXTRACTION_PROFILE
+    and DJGARO_DLP_OPTIONS(a JSON object of yt_dlp options) settings.
+    """
+
+    mode = env_str("DJGARO_EXTRACTOR", EXTRACTOR_MODE).lower()
+    timeout = env_float("DJGARO_EXTRACTION_TIMEOUT", EXTRACTION_TIMEOUT)
+    ie_key = None
+    if dlp_options is None:
+        dlp_options, ie_key = extraction_options(
+            env_str("DJGARO_EXTRACTION_PROFILE", EXTRACTION_PROFILE).lower(),
+            json_loads(env_str("DJGARO_DLP_OPTIONS", "{}")),
+        )
+    if mode == "process":
+        workers = env_int("DJGARO_EXTRACTOR_WORKERS", 0) or None
+        return ProcessExtractor(
+            dlp_options, timeout=timeout, workers=workers, ie_key=ie_key
+        )
+    if mode != "thread":
+        LOGGER.warning(f"Unknown extractor mode '{mode}', falling back to 'thread'")
+    return ThreadExtractor(dlp_options, timeout=timeout, ie_key=ie_key)
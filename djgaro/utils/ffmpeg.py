@@ -0,0 +1,188 @@
+from asyncio import AbstractEventLoop, Event, TimeoutError, get_running_loop, wait_for
+import os
+import threading
+from time import monotonic
+from typing import Any, Dict, Iterable, Optional, Tuple
+from logging import getLogger
+
+from discord import FFmpegOpusAudio
+
+from djgaro.utils.config import env_float, env_int
+from djgaro.utils.constants import (
+    DEGRADED_TRANSCODE_BITRATE,
+    TRANSCODE_QUEUE_TIMEOUT,
+    TRANSCODES_PER_CPU,
+)
+
+
+LOGGER = getLogger("dj_garo")
+
+# Bitrates(kbps) libopus can encode
+MIN_OPUS_BITRATE = 6
+MAX_OPUS_BITRATE = 510
+
+
+def channel_bitrate(voice_client: Any, source_bitrate: Optional[float] = None) -> int:
+    """Encode bitrate(kbps) for a voice channel, never above the bitrate of the source itself"""
+
+    channel = getattr(voice_client, "channel", None)
+    bitrate = (getattr(channel, "bitrate", None) or 128000) // 1000
+    if source_bitrate:
+        bitrate = min(bitrate, round(source_bitrate))
+    return max(min(bitrate, MAX_OPUS_BITRATE), MIN_OPUS_BITRATE)
+
+
+class FFmpegGovernor(object):
+    """Keeps track of every ffmpeg process the bot runs and limits how many of them transcode at once.
+
+    Passing an opus stream through costs next to nothing, re-encoding one costs a good share
+    of a CPU core. A transcode which finds every slot taken waits up to `queue_timeout`
+    seconds for one, after that it starts anyway with cheaper encoder settings(degraded),
+    a song is never refused. Sources are released by their `cleanup`, which discord calls
+    from the audio player threads.
+    """
+
+    def __init__(self, max_transcodes: int, queue_timeout: float) -> None:
+        self.max_transcodes = max_transcodes
+        self.queue_timeout = queue_timeout
+        self.degraded = 0
+        self._lock = threading.Lock()
+        self._transcodes = 0
+        # Running source -> (guild id, whether it holds a transcode slot)
+        self._sources: Dict[Any, Tuple[int, bool]] = {}
+        self._loop: Optional[AbstractEventLoop] = None
+        self._slot_freed = Event()
+
+    @property
+    def transcodes(self) -> int:
+        return self._transcodes
+
+    async def acquire_transcode(self) -> bool:
+        """Takes a transcode slot, returns False if none got free in time and the transcode should be degraded"""
+
+        self._loop = get_running_loop()
+        deadline = monotonic() + self.queue_timeout
+        while True:
+            with self._lock:
+                if self._transcodes < self.max_transcodes:
+                    self._transcodes += 1
+                    return True
+
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                self.degraded += 1
+                return False
+            try:
+                await wait_for(self._slot_freed.wait(), remaining)
+            except TimeoutError:
+                pass
+
+    def release_transcode(self) -> None:
+        """Frees a slot taken by `acquire_transcode` whose source was never started"""
+
+        with self._lock:
+            self._transcodes -= 1
+        self._notify_slot_freed()
+
+    def track(self, source: Any, guild_id: int, holds_slot: bool) -> None:
+        with self._lock:
+            self._sources[source] = (guild_id, holds_slot)
+
+    def release(self, source: Any) -> None:
+        """Forgets a cleaned up source and frees its slot, safe to call from any thread and more than once"""
+
+        with self._lock:
+            entry = self._sources.pop(source, None)
+            holds_slot = entry is not None and entry[1]
+            if holds_slot:
+                self._transcodes -= 1
+        if holds_slot:
+            self._notify_slot_freed()
+
+    def reap(self, guild_id: Optional[int] = None, keep: Iterable[Any] = ()) -> int:
+        """Kills the ffmpeg processes of the guild(or of every guild) except those of the `keep` sources.
+
+        Returns the number of processes which were killed.
+        """
+
+        keep = {id(source) for source in keep if source is not None}
+        with self._lock:
+            orphans = [
+                source
+                for source, (source_guild_id, _) in self._sources.items()
+                if (guild_id is None or source_guild_id == guild_id)
+                and id(source) not in keep
+            ]
+
+        for source in orphans:
+            try:
+                source.cleanup()
+            except Exception as exc:
+                LOGGER.error(f"[FFmpeg] - Killing an ffmpeg process failed: {exc}")
+            self.release(source)
+        if orphans:
+            LOGGER.info(f"[FFmpeg] - Reaped {len(orphans)} orphaned ffmpeg processes")
+        return len(orphans)
+
+    def _notify_slot_freed(self) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return None
+        try:
+            if get_running_loop() is loop:
+                self._wake_waiters()
+                return None
+        except RuntimeError:
+            # Called from an audio player thread
+            pass
+        loop.call_soon_threadsafe(self._wake_waiters)
+
+    def _wake_waiters(self) -> None:
+        self._slot_freed.set()
+        self._slot_freed = Event()
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+
+class GovernedOpusAudio(FFmpegOpusAudio):
+    """FFmpegOpusAudio which reports its process to a governor and releases it on cleanup"""
+
+    def __init__(
+        self,
+        source: str,
+        *,
+        governor: FFmpegGovernor,
+        guild_id: int,
+        holds_slot: bool = False,
+        **kwargs: Any,
+    ) -> None:
+        self._governor = governor
+        super().__init__(source, **kwargs)
+        governor.track(self, guild_id, holds_slot)
+
+    def cleanup(self) -> None:
+        try:
+            super().cleanup()
+        finally:
+            self._governor.release(self)
+
+
+def degraded_options(bitrate: int) -> Tuple[int, str]:
+    """Bitrate and extra ffmpeg output options of a transcode which runs over the limit"""
+
+    # The fastest, lowest quality libopus mode, at a lower bitrate
+    return min(bitrate, DEGRADED_TRANSCODE_BITRATE), "-compression_level 0"
+
+
+def create_ffmpeg_governor() -> FFmpegGovernor:
+    """Creates the governor configured by the DJGARO_MAX_TRANSCODES and DJGARO_TRANSCODE_QUEUE_TIMEOUT settings"""
+
+    return FFmpegGovernor(
+        max_transcodes=env_int(
+            "DJGARO_MAX_TRANSCODES", (os.cpu_count() or 1) * TRANSCODES_PER_CPU
+        ),
+        queue_timeout=env_float(
+            "DJGARO_TRANSCODE_QUEUE_TIMEOUT", TRANSCODE_QUEUE_TIMEOUT
+        ),
+    )
@@ -0,0 +1,35 @@
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from djgaro.utils.config import env_float, env_int
+from djgaro.utils.constants import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_TOTAL_TIMEOUT,
+)
+
+
+def create_http_session() -> ClientSession:
+    """Creates a long-lived HTTP client with keep-alive connection pooling and DNS caching.
+
+    Must be called from a running event loop, the caller owns the session and must close it.
+    """
+
+    connector = TCPConnector(
+        limit=env_int("DJGARO_HTTP_POOL_LIMIT", HTTP_POOL_LIMIT),
+        limit_per_host=env_int(
+            "DJGARO_HTTP_POOL_LIMIT_PER_HOST", HTTP_POOL_LIMIT_PER_HOST
+        ),
+        keepalive_timeout=env_float(
+            "DJGARO_HTTP_KEEPALIVE_TIMEOUT", HTTP_KEEPALIVE_TIMEOUT
+        ),
+        ttl_dns_cache=env_int("DJGARO_HTTP_DNS_CACHE_TTL", HTTP_DNS_CACHE_TTL),
+        use_dns_cache=True,
+    )
+    timeout = ClientTimeout(
+        total=env_float("DJGARO_HTTP_TOTAL_TIMEOUT", HTTP_TOTAL_TIMEOUT),
+        sock_connect=env_float("DJGARO_HTTP_CONNECT_TIMEOUT", HTTP_CONNECT_TIMEOUT),
+    )
+    return ClientSession(connector=connector, timeout=timeout)
@@ -0,0 +1,111 @@
+import atexit
+from json import dumps as json_dumps
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+import random
+import threading
+from time import monotonic
+from typing import Dict, Tuple
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats every record as a single line JSON object"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "file": record.filename,
+            "function": record.funcName,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json_dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a random `rate` share of the records below WARNING"""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through at most `per_second` records below WARNING from the same line of code.
+
+    Every logging call site gets a token bucket which holds up to one second worth of
+    records(at least one). The number of dropped records is appended to the next record
+    let through.
+    """
+
+    def __init__(self, per_second: float) -> None:
+        super().__init__()
+        self.per_second = per_second
+        self.burst = max(per_second, 1.0)
+        self._lock = threading.Lock()
+        # Call site -> (tokens, time of the last refill, records dropped since the last one let through)
+        self._buckets: Dict[Tuple[str, int], Tuple[float, float, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        key, now = (record.pathname, record.lineno), monotonic()
+        with self._lock:
+            tokens, last_refill, dropped = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(tokens + (now - last_refill) * self.per_second, self.burst)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, dropped + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+
+        if dropped:
+            record.msg = f"{record.msg} ({dropped} similar messages dropped)"
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records over to a listener thread without formatting them, drops them if the queue is full"""
+
+    def __init__(self, queue: Queue) -> None:
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue never leaves the process, the listener formats the original record
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+def move_handlers_to_thread(logger: logging.Logger, queue_size: int) -> QueueListener:
+    """Replaces the handlers of `logger` with a queue, a background thread passes the records on to them.
+
+    Formatting and I/O(e.g. writing and rolling over log files) then never run on the
+    event loop or extraction threads. The listener is stopped, and the queue flushed, at exit.
+    """
+
+    handlers = list(logger.handlers)
+    queue_handler = NonBlockingQueueHandler(Queue(maxsize=queue_size))
+
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
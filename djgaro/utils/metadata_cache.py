@@ -0,0 +1,204 @@
+from asyncio import Task, create_task, get_running_loop, sleep
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps as json_dumps, loads as json_loads
+import sqlite3
+from time import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from logging import getLogger
+
+from djgaro.utils.config import env_float, env_int, env_str
+from djgaro.utils.constants import (
+    METADATA_CACHE_FLUSH_BATCH,
+    METADATA_CACHE_FLUSH_DELAY,
+    METADATA_CACHE_PATH,
+    METADATA_CACHE_SIZE,
+    PLAYLIST_ITEMS_TTL,
+    SEARCH_RESULTS_TTL,
+    VIDEO_METADATA_TTL,
+)
+
+
+LOGGER = getLogger("dj_garo")
+
+# SQLite limits the number of bound parameters of a single statement
+_SELECT_CHUNK = 500
+
+
+class MetadataCache(object):
+    """SQLite backed cache of youtube API lookups which survives bot restarts.
+
+    Values are JSON serializable objects stored under a `kind`(e.g. 'video', 'playlist',
+    'search') and a key, every kind has its own TTL. All database work runs on one
+    dedicated thread, writes are buffered and flushed in batches, and the least recently
+    used entries are evicted once the cache holds more than `max_entries` entries.
+    Database errors are logged and treated as cache misses.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttls: Dict[str, float],
+        max_entries: int = METADATA_CACHE_SIZE,
+        flush_delay: float = METADATA_CACHE_FLUSH_DELAY,
+    ) -> None:
+        self.path = path
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.flush_delay = flush_delay
+        self.hits = 0
+        self.misses = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="dj_garo_cache"
+        )
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pending: Dict[Tuple[str, str], Tuple[Any, float]] = {}
+        self._flush_task: Optional[Task] = None
+
+    async def get_many(self, kind: str, keys: List[str]) -> Dict[str, Any]:
+        """Returns the cached, not yet expired values of the given keys"""
+
+        now = time()
+        found, missing = {}, []
+        for key in dict.fromkeys(keys):
+            pending = self._pending.get((kind, key))
+            if pending and pending[1] > now:
+                found[key] = pending[0]
+            else:
+                missing.append(key)
+
+        if missing:
+            found.update(await self._run(self._select, kind, missing, now) or {})
+
+        self.hits += len(found)
+        self.misses += len(set(keys)) - len(found)
+        return found
+
+    async def get(self, kind: str, key: str) -> Optional[Any]:
+        return (await self.get_many(kind, [key])).get(key)
+
+    def put_many(self, kind: str, values: Dict[str, Any]) -> None:
+        """Buffers the values, they are written to the database in the background"""
+
+        expires_at = time() + self.ttls.get(kind, 0)
+        for key, value in values.items():
+            self._pending[(kind, key)] = (value, expires_at)
+
+        if len(self._pending) >= METADATA_CACHE_FLUSH_BATCH:
+            create_task(self.flush())
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = create_task(self._flush_later())
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        self.put_many(kind, {key: value})
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return None
+
+        rows = [
+            (kind, key, json_dumps(value), expires_at)
+            for (kind, key), (value, expires_at) in self._pending.items()
+        ]
+        self._pending = {}
+        await self._run(self._write, rows)
+
+    async def close(self) -> None:
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+    async def _flush_later(self) -> None:
+        await sleep(self.flush_delay)
+        await self.flush()
+
+    async def _run(self, function: Callable, *args) -> Any:
+        try:
+            return await get_running_loop().run_in_executor(
+                self._executor, function, *args
+            )
+        except sqlite3.Error as exc:
+            LOGGER.error(f"[Metadata Cache] - Database error: {exc}")
+            return None
+
+    ##################################### Database thread only ###################################
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(
+                """
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                CREATE TABLE IF NOT EXISTS cache (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (kind, key)
+                );
+                CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at);
+                """
+            )
+        return self._connection
+
+    def _select(self, kind: str, keys: List[str], now: float) -> Dict[str, Any]:
+        connection = self._connect()
+        found = {}
+        for start in range(0, len(keys), _SELECT_CHUNK):
+            chunk = keys[start : start + _SELECT_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT key, value FROM cache WHERE kind = ? AND key IN ({placeholders}) AND expires_at > ?",
+                (kind, *chunk, now),
+            ).fetchall()
+            for key, value in rows:
+                found[key] = json_loads(value)
+
+        if found:
+            connection.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE kind = ? AND key = ?",
+                [(now, kind, key) for key in found],
+            )
+            connection.commit()
+        return found
+
+    def _write(self, rows: List[Tuple[str, str, str, float]]) -> None:
+        connection = self._connect()
+        now = time()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (kind, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                [(*row, now) for row in rows],
+            )
+            connection.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            (entry_count,) = connection.execute("SELECT COUNT(*) FROM cache").fetchone()
+            if entry_count > self.max_entries:
+                connection.execute(
+                    "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (entry_count - self.max_entries,),
+                )
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def create_metadata_cache() -> Optional[MetadataCache]:
+    """Creates the cache configured by the DJGARO_METADATA_CACHE_* settings, None if it's disabled"""
+
+    max_entries = env_int("DJGARO_METADATA_CACHE_SIZE", METADATA_CACHE_SIZE)
+    if max_entries <= 0:
+        return None
+
+    return MetadataCache(
+        env_str("DJGARO_METADATA_CACHE_PATH", METADATA_CACHE_PATH),
+        ttls={
+            "video": env_float("DJGARO_VIDEO_METADATA_TTL", VIDEO_METADATA_TTL),
+            "playlist": env_float("DJGARO_PLAYLIST_ITEMS_TTL", PLAYLIST_ITEMS_TTL),
+            "search": env_float("DJGARO_SEARCH_RESULTS_TTL", SEARCH_RESULTS_TTL),
+        },
+        max_entries=max_entries,
+    )
@@ -0,0 +1,142 @@
+from attr import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple
+from logging import getLogger
+
+from djgaro.utils.stats import PLAY_STATS, LatencyStats
+
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+
+LOGGER = getLogger("dj_garo")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@dataclass(slots=True)
+class Metric:
+    """A metric family, samples are (name suffix, labels, value) e.g. ('_bucket', {'le': '0.1'}, 3)"""
+
+    name: str
+    kind: str
+    help: str
+    samples: List[Tuple[str, Dict[str, str], float]] = field(factory=list)
+
+    def add(self, value: float, *, suffix: str = "", **labels: str) -> "Metric":
+        self.samples.append((suffix, labels, value))
+        return self
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_metrics(metrics: Iterable[Metric]) -> str:
+    """Formats the metrics in the Prometheus text exposition format"""
+
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, labels, value in metric.samples:
+            label_text = ",".join(
+                f'{name}="{_escape(str(label))}"' for name, label in labels.items()
+            )
+            label_text = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{metric.name}{suffix}{label_text} {_format_value(value)}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def latency_metrics(stats: LatencyStats = PLAY_STATS) -> List[Metric]:
+    """Histograms and error counts of the timed stages(extractions, API calls, event loop lag, ...)"""
+
+    durations = Metric(
+        "djgaro_stage_duration_seconds", "histogram", "Duration of the timed stages"
+    )
+    for stage, histogram in sorted(stats.stages.items()):
+        cumulative = 0
+        for upper, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            durations.add(cumulative, suffix="_bucket", stage=stage, le=f"{upper:g}")
+        durations.add(histogram.count, suffix="_bucket", stage=stage, le="+Inf")
+        durations.add(histogram.total, suffix="_sum", stage=stage)
+        durations.add(histogram.count, suffix="_count", stage=stage)
+
+    errors = Metric(
+        "djgaro_stage_errors_total", "counter", "Failed runs of the timed stages"
+    )
+    for stage, count in sorted(stats.errors.items()):
+        errors.add(count, stage=stage)
+    return [durations, errors]
+
+
+def cog_metrics(bot) -> List[Metric]:
+    """Metrics of every loaded cog which has a `collect_metrics` method"""
+
+    metrics = []
+    for cog in list(bot.cogs.values()):
+        collect = getattr(cog, "collect_metrics", None)
+        if collect is not None:
+            metrics.extend(collect())
+    return metrics
+
+
+class MetricsServer(object):
+    """Serves the metrics of the running bot on http://`host`:`port`/metrics.
+
+    Every collector returns the current values of its metrics when the endpoint is scraped,
+    nothing is computed between scrapes.
+    """
+
+    def __init__(
+        self,
+        collectors: List[Callable[[], Iterable[Metric]]],
+        host: str,
+        port: int,
+    ) -> None:
+        self.collectors = collectors
+        self.host = host
+        self.port = port
+        self._runner: Optional["web.AppRunner"] = None
+
+    async def start(self) -> None:
+        # Only imported when the metrics are turned on, it isn't needed otherwise
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        LOGGER.info(
+            f"[Metrics] - Serving metrics on http://{self.host}:{self.port}/metrics"
+        )
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def render(self) -> str:
+        metrics = []
+        for collector in self.collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as exc:
+                LOGGER.error(f"[Metrics] - Collecting metrics failed: {exc}")
+        return format_metrics(metrics)
+
+    async def _handle_metrics(self, request: "web.Request") -> "web.Response":
+        from aiohttp import web
+
+        return web.Response(
+            body=self.render().encode(), headers={"Content-Type": CONTENT_TYPE}
+        )
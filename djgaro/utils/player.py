@@ -0,0 +1,361 @@
+from asyncio import (
+    AbstractEventLoop,
+    CancelledError,
+    Event,
+    Lock,
+    Task,
+    create_task,
+    get_running_loop,
+    run_coroutine_threadsafe,
+    sleep,
+)
+from concurrent.futures import Future
+from enum import Enum
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+)
+from discord import AudioSource, VoiceClient
+from logging import getLogger
+from time import monotonic
+
+from djgaro.utils.song_queue import PlaylistItem, SongQueue
+
+
+if TYPE_CHECKING:
+    from discord.abc import Messageable
+    from djgaro.utils.prefetch import Prefetcher
+
+
+LOGGER = getLogger("dj_garo")
+
+
+class LoopMode(Enum):
+    NO_REPEAT = 1
+    REPEAT_ONE = 2
+    REPEAT_ALL = 3
+
+
+class GuildPlayer(object):
+    """Playback state (queue, cursor, loop mode, voice client) of a single guild"""
+
+    def __init__(self, guild_id: int) -> None:
+        self.guild_id = guild_id
+        self.playlist = SongQueue()
+        self.song_idx = 0
+        self.voice_client: Optional[VoiceClient] = None
+        # Channel of the command that started the current stream
+        self.text_channel: Optional["Messageable"] = None
+        self.repeat_mode = LoopMode.REPEAT_ALL
+        # Every started stream gets a new token, the 'after' callback of a stream
+        # only advances the queue if its token is still the current one.
+        self._play_token = 0
+        # Held while the player moves to another song, so that commands and the end of a
+        # song never start two streams at once
+        self.transition_lock = Lock()
+        self._loop: Optional[AbstractEventLoop] = None
+        self._loading_task: Optional[Task] = None
+        self._items_added = Event()
+        self.prefetcher: Optional["Prefetcher"] = None
+        # Audio source of the next song, opened shortly before the current one ends
+        self._preloaded: Optional[Tuple[int, PlaylistItem, AudioSource]] = None
+        self._preload_task: Optional[Task] = None
+        self._started_at = 0.0
+        self._paused_at: Optional[float] = None
+        self._paused_for = 0.0
+
+    @property
+    def current(self) -> Optional[PlaylistItem]:
+        if 0 <= self.song_idx < len(self.playlist):
+            return self.playlist[self.song_idx]
+        return None
+
+    @property
+    def is_loading(self) -> bool:
+        """True while songs are still being appended to the queue in the background"""
+        return self._loading_task is not None and not self._loading_task.done()
+
+    @property
+    def play_token(self) -> int:
+        """Changes whenever a stream is started or stopped"""
+        return self._play_token
+
+    @property
+    def preloaded_source(self) -> Optional[AudioSource]:
+        return self._preloaded[2] if self._preloaded else None
+
+    @property
+    def position(self) -> float:
+        """Seconds of the current song played so far, paused time excluded"""
+
+        paused_for = self._paused_for
+        if self._paused_at is not None:
+            paused_for += monotonic() - self._paused_at
+        return monotonic() - self._started_at - paused_for
+
+    def next_playable_index(self, start: int, *, wrap: bool = False) -> Optional[int]:
+        """Returns the first index from `start` onwards whose song has not failed to resolve"""
+        return self.playlist.next_playable(start, wrap=wrap)
+
+    def previous_playable_index(self, start: int) -> Optional[int]:
+        """Returns the last index up to `start` whose song has not failed to resolve"""
+        return self.playlist.previous_playable(start)
+
+    def insert(self, index: int, item: PlaylistItem) -> None:
+        """Inserts a song into the queue, the cursor keeps pointing at the current song"""
+
+        index = min(max(index, 0), len(self.playlist))
+        self.discard_preloaded()
+        self.playlist.insert(index, item)
+        if index <= self.song_idx and len(self.playlist) > 1:
+            self.song_idx += 1
+
+    def remove(self, index: int) -> PlaylistItem:
+        """Removes a song from the queue, removing the current song moves the cursor to the following one"""
+
+        self.discard_preloaded()
+        item = self.playlist.remove(index)
+        if index < self.song_idx:
+            self.song_idx -= 1
+        self.song_idx = min(self.song_idx, max(len(self.playlist) - 1, 0))
+        return item
+
+    def shuffle(self) -> None:
+        """Shuffles the queue, the current song becomes the first one"""
+
+        self.discard_preloaded()
+        if self.playlist:
+            self.playlist.shuffle(first=self.song_idx)
+            self.song_idx = 0
+
+    def reset(self) -> None:
+        """Stops the current stream and empties the queue, the loop mode is kept"""
+
+        self.stop()
+        self.discard_preloaded()
+        self.cancel_loading()
+        if self.prefetcher:
+            self.prefetcher.cancel()
+        self.playlist = SongQueue()
+        self.song_idx = 0
+        # Waiters of the old queue give up instead of waiting for the new one
+        self.notify_items_added()
+
+    def start_loading(self, loader: Coroutine[Any, Any, None]) -> Task:
+        """Runs `loader`, which appends songs to the queue, as a background task"""
+
+        self.cancel_loading()
+        self._loading_task = create_task(loader)
+        self._loading_task.add_done_callback(self._loading_finished)
+        return self._loading_task
+
+    def cancel_loading(self) -> None:
+        if self.is_loading:
+            self._loading_task.cancel()
+
+    def notify_items_added(self) -> None:
+        """Wakes up everyone waiting in `wait_for_items`"""
+
+        self._items_added.set()
+        self._items_added = Event()
+
+    async def wait_for_items(self, count: int = 1) -> None:
+        """Waits until the queue holds at least `count` songs, loading has finished or the queue was replaced"""
+
+        playlist = self.playlist
+        while playlist is self.playlist and len(playlist) < count and self.is_loading:
+            await self._items_added.wait()
+
+    def _loading_finished(self, task: Task) -> None:
+        try:
+            exc = task.exception()
+        except CancelledError:
+            exc = None
+        if exc:
+            LOGGER.error(
+                f"[Playlist Loading] - Error while loading the playlist: {exc}"
+            )
+        self.notify_items_added()
+
+    def play(
+        self,
+        audio_source: AudioSource,
+        on_finished: Callable[[], Awaitable[None]],
+        offset: float = 0.0,
+    ) -> None:
+        """Starts streaming `audio_source`, `on_finished` is scheduled once the stream ends by itself.
+
+        `offset` is the position in the song at which the stream starts.
+        """
+
+        self._loop = get_running_loop()
+        self._play_token += 1
+        self._started_at = monotonic() - offset
+        self._paused_at, self._paused_for = None, 0.0
+        self.voice_client.play(
+            audio_source, after=self._finished_callback(self._play_token, on_finished)
+        )
+
+    def pause(self) -> None:
+        if self.voice_client and self.voice_client.is_playing():
+            self.voice_client.pause()
+            self._paused_at = monotonic()
+
+    def resume(self) -> None:
+        if self.voice_client and self.voice_client.is_paused():
+            self.voice_client.resume()
+        if self._paused_at is not None:
+            self._paused_for += monotonic() - self._paused_at
+            self._paused_at = None
+
+    def stop(self) -> None:
+        """Stops the current stream without advancing the queue, an already opened next song is kept"""
+
+        self._play_token += 1
+        self.cancel_preload()
+        if self.voice_client and (
+            self.voice_client.is_playing() or self.voice_client.is_paused()
+        ):
+            self.voice_client.stop()
+
+    def schedule_preload(
+        self, lead: float, preload: Callable[[], Awaitable[None]]
+    ) -> None:
+        """Runs `preload` once the current song has less than `lead` seconds left"""
+
+        self.cancel_preload()
+        self._preload_task = create_task(self._preload_when_due(lead, preload))
+
+    def cancel_preload(self) -> None:
+        if self._preload_task and not self._preload_task.done():
+            self._preload_task.cancel()
+        self._preload_task = None
+
+    def set_preloaded(self, index: int, audio_source: AudioSource) -> None:
+        """Keeps the opened audio source of the song at `index` until it's played or discarded"""
+
+        self.discard_preloaded(cancel=False)
+        self._preloaded = (index, self.playlist[index], audio_source)
+
+    def take_preloaded(self, index: int) -> Optional[AudioSource]:
+        """Returns the opened audio source of the song at `index`, a source opened for another song is discarded"""
+
+        if self._preloaded is None:
+            return None
+        preloaded_index, item, audio_source = self._preloaded
+        if preloaded_index != index or self.playlist[index] is not item:
+            self.discard_preloaded(cancel=False)
+            return None
+        self._preloaded = None
+        return audio_source
+
+    def discard_preloaded(self, *, cancel: bool = True) -> None:
+        """Closes the opened audio source of the next song, e.g. because the queue changed"""
+
+        if cancel:
+            self.cancel_preload()
+        if self._preloaded is None:
+            return None
+        _, item, audio_source = self._preloaded
+        self._preloaded = None
+        try:
+            audio_source.cleanup()
+        except Exception as exc:
+            LOGGER.error(
+                f"[Preload] - Closing the audio source of {item.video_id} failed: {exc}"
+            )
+
+    async def _preload_when_due(
+        self, lead: float, preload: Callable[[], Awaitable[None]]
+    ) -> None:
+        current = self.current
+        # Nothing to go by for songs of unknown length(e.g. live streams)
+        if current is None or current.duration <= 0:
+            return None
+        while True:
+            remaining = current.duration - self.position - lead
+            if remaining <= 0 and self._paused_at is None:
+                break
+            await sleep(max(remaining, 1.0))
+        try:
+            await preload()
+        except CancelledError:
+            raise
+        except Exception as exc:
+            LOGGER.error(f"[Preload] - Opening the next song failed: {exc}")
+
+    def _finished_callback(
+        self, token: int, on_finished: Callable[[], Awaitable[None]]
+    ) -> Callable[[Optional[Exception]], None]:
+        def handle_finished_stream(e: Optional[Exception]) -> None:
+            # Called from the voice client's audio thread, not the event loop
+            if e:
+                LOGGER.error(f"AudioStream Player Error: {e}")
+            if token == self._play_token and self._loop and not self._loop.is_closed():
+                future = run_coroutine_threadsafe(
+                    self._advance(token, on_finished), self._loop
+                )
+                future.add_done_callback(self._next_song_finished)
+
+        return handle_finished_stream
+
+    async def _advance(
+        self, token: int, on_finished: Callable[[], Awaitable[None]]
+    ) -> None:
+        async with self.transition_lock:
+            # A command may have started another song while this one was ending
+            if token == self._play_token:
+                await on_finished()
+
+    def _next_song_finished(self, future: "Future[None]") -> None:
+        # Nobody awaits the scheduled coroutine, its errors would be dropped silently
+        if future.cancelled():
+            return None
+        exc = future.exception()
+        if exc:
+            LOGGER.error(
+                f"[Next Song] - Error while starting the next song of guild {self.guild_id}: {exc}"
+            )
+
+
+class PlayerRegistry(object):
+    """Lazily created `GuildPlayer` instances keyed by guild id"""
+
+    def __init__(
+        self, player_factory: Callable[[int], GuildPlayer] = GuildPlayer
+    ) -> None:
+        self._player_factory = player_factory
+        self._players: Dict[int, GuildPlayer] = {}
+
+    def get(self, guild_id: int) -> GuildPlayer:
+        player = self._players.get(guild_id)
+        if player is None:
+            player = self._player_factory(guild_id)
+            self._players[guild_id] = player
+        return player
+
+    def peek(self, guild_id: int) -> Optional[GuildPlayer]:
+        """Returns the player of the guild without creating one"""
+        return self._players.get(guild_id)
+
+    def discard(self, guild_id: int) -> None:
+        player = self._players.pop(guild_id, None)
+        if player:
+            player.reset()
+            player.voice_client = None
+
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self._players
+
+    def __len__(self) -> int:
+        return len(self._players)
+
+    def __iter__(self) -> Iterator[GuildPlayer]:
+        return iter(list(self._players.values()))
@@ -0,0 +1,82 @@
+from asyncio import CancelledError, Semaphore, Task, create_task
+from typing import Awaitable, Callable, Dict, List
+from logging import getLogger
+
+from djgaro.utils.player import GuildPlayer, LoopMode, PlaylistItem
+
+
+LOGGER = getLogger("dj_garo")
+
+
+class Prefetcher(object):
+    """Resolves the stream URLs of the next few songs of a player's queue in the background.
+
+    At most `window` upcoming songs are resolved ahead of the cursor, the number of
+    extractions running at the same time is bounded by the (usually shared) `limit`.
+    Songs which cannot be resolved are marked as failed so the cursor skips them.
+    """
+
+    def __init__(
+        self,
+        player: GuildPlayer,
+        resolve: Callable[[PlaylistItem], Awaitable[str]],
+        window: int,
+        limit: Semaphore,
+    ) -> None:
+        self._player = player
+        self._resolve = resolve
+        self.window = window
+        self._limit = limit
+        # Keyed by the id() of the PlaylistItem being resolved
+        self._tasks: Dict[int, Task] = {}
+
+    def schedule(self) -> None:
+        """Starts resolving the songs in the look-ahead window and drops work that fell out of it"""
+
+        upcoming = self._upcoming()
+        upcoming_keys = {id(item) for item in upcoming}
+        for key, task in list(self._tasks.items()):
+            if key not in upcoming_keys:
+                task.cancel()
+
+        for item in upcoming:
+            key = id(item)
+            if item.raw_url or item.failed or key in self._tasks:
+                continue
+            task = create_task(self._prefetch(item))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _, key=key: self._tasks.pop(key, None))
+
+    def cancel(self) -> None:
+        for task in list(self._tasks.values()):
+            task.cancel()
+        self._tasks.clear()
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def _upcoming(self) -> List[PlaylistItem]:
+        playlist = self._player.playlist
+        song_count = len(playlist)
+        wrap = self._player.repeat_mode != LoopMode.NO_REPEAT
+
+        upcoming = []
+        for offset in range(1, min(self.window, song_count) + 1):
+            index = self._player.song_idx + offset
+            if index >= song_count:
+                if not wrap:
+                    break
+                index %= song_count
+            upcoming.append(playlist[index])
+        return upcoming
+
+    async def _prefetch(self, item: PlaylistItem) -> None:
+        try:
+            async with self._limit:
+                if not item.raw_url and not item.failed:
+                    await self._resolve(item)
+        except CancelledError:
+            raise
+        except Exception as exc:
+            LOGGER.error(f"[Prefetch] - Error while resolving {item.yt_url}: {exc}")
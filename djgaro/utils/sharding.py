@@ -0,0 +1,204 @@
+from json import loads as json_loads
+from multiprocessing import get_context
+from multiprocessing.process import BaseProcess
+import signal
+from time import monotonic, sleep
+from typing import Callable, Dict, List
+from urllib.request import Request, urlopen
+from logging import getLogger
+
+from djgaro.utils.constants import (
+    DISCORD_GATEWAY_BOT_URL,
+    SHARD_IDENTIFY_INTERVAL,
+    WORKER_MAX_RESTART_DELAY,
+    WORKER_RESTART_DELAY,
+    WORKER_STOP_TIMEOUT,
+)
+
+
+LOGGER = getLogger("dj_garo")
+
+
+def parse_shard_ids(spec: str) -> List[int]:
+    """Parses shard IDs written like '0-3,8,10-11'"""
+
+    shard_ids = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        shard_ids.extend(range(int(first), int(last or first) + 1))
+    return shard_ids
+
+
+def assign_shards(
+    shard_count: int, processes: int, assignment: str = ""
+) -> List[List[int]]:
+    """Returns the shard IDs of every worker process.
+
+    An explicit `assignment` lists the shards of every process separated by ';'(e.g. '0-3;4-7'),
+    every shard must be run by exactly one process. Otherwise the shards are split into
+    `processes` contiguous, evenly sized ranges.
+    """
+
+    if assignment.strip():
+        groups = [parse_shard_ids(part) for part in assignment.split(";")]
+        groups = [group for group in groups if group]
+        shard_ids = [shard_id for group in groups for shard_id in group]
+        invalid = [
+            shard_id for shard_id in shard_ids if not 0 <= shard_id < shard_count
+        ]
+        if invalid:
+            raise ValueError(
+                f"Shard IDs {invalid} are out of range for {shard_count} shards"
+            )
+        # A shard run twice opens two gateway sessions for the same servers
+        duplicates = sorted(
+            {shard_id for shard_id in shard_ids if shard_ids.count(shard_id) > 1}
+        )
+        if duplicates:
+            raise ValueError(f"Shard IDs {duplicates} are assigned more than once")
+        missing = sorted(set(range(shard_count)) - set(shard_ids))
+        if missing:
+            raise ValueError(
+                f"Shard IDs {missing} of {shard_count} shards aren't assigned to any process"
+            )
+        return groups
+
+    processes = max(min(processes, shard_count), 1)
+    size, extra = divmod(shard_count, processes)
+    groups, first = [], 0
+    for index in range(processes):
+        last = first + size + (1 if index < extra else 0)
+        groups.append(list(range(first, last)))
+        first = last
+    return groups
+
+
+def recommended_shard_count(token: str) -> int:
+    """Asks discord how many shards the bot should run with"""
+
+    request = Request(
+        DISCORD_GATEWAY_BOT_URL,
+        headers={
+            "Authorization": f"Bot {token}",
+            "User-Agent": "DiscordBot (https://github.com/AIckovski/DJGaro, 0.0.1)",
+        },
+    )
+    with urlopen(request, timeout=10) as response:
+        return int(json_loads(response.read())["shards"])
+
+
+class ShardSupervisor(object):
+    """Runs every group of shards in its own worker process and restarts workers which crash.
+
+    Only the crashed worker is restarted, with an exponentially growing delay while it keeps
+    crashing shortly after being started. The first start of the workers is staggered so that
+    their shards don't exceed discord's limit of one gateway login(identify) per 5 seconds.
+    Workers which exit cleanly aren't restarted. On SIGTERM or Ctrl-C every worker gets a
+    SIGTERM and `stop_timeout` seconds to close its bot before it's killed.
+    """
+
+    def __init__(
+        self,
+        target: Callable[[int, List[int], int, int], None],
+        shard_groups: List[List[int]],
+        shard_count: int,
+        restart_delay: float = WORKER_RESTART_DELAY,
+        max_restart_delay: float = WORKER_MAX_RESTART_DELAY,
+        stop_timeout: float = WORKER_STOP_TIMEOUT,
+    ) -> None:
+        self._target = target
+        self.shard_groups = shard_groups
+        self.shard_count = shard_count
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stop_timeout = stop_timeout
+        self._context = get_context("spawn")
+        self._workers: Dict[int, BaseProcess] = {}
+        self._started_at: Dict[int, float] = {}
+        self._delays: Dict[int, float] = {}
+        self._restart_at: Dict[int, float] = {}
+        self._stopping = False
+
+    def run(self) -> int:
+        previous_handler = signal.signal(signal.SIGTERM, self._stop)
+        try:
+            start_delay = 0.0
+            for index, shard_ids in enumerate(self.shard_groups):
+                self._restart_at[index] = monotonic() + start_delay
+                start_delay += len(shard_ids) * SHARD_IDENTIFY_INTERVAL
+
+            while not self._stopping:
+                self._check_workers()
+                if not self._workers and not self._restart_at:
+                    break
+                sleep(0.5)
+        except KeyboardInterrupt:
+            LOGGER.info("[Supervisor] - Stopping the workers...")
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+            self._stop_workers()
+        return 0
+
+    def _check_workers(self) -> None:
+        now = monotonic()
+        for index, start_at in list(self._restart_at.items()):
+            if now >= start_at:
+                del self._restart_at[index]
+                self._start_worker(index)
+
+        for index, process in list(self._workers.items()):
+            if process.is_alive():
+                continue
+
+            del self._workers[index]
+            if process.exitcode == 0:
+                LOGGER.info(f"[Supervisor] - Worker {index} exited")
+                continue
+
+            # A worker which ran for a while before crashing is restarted quickly again
+            if now - self._started_at[index] > self.max_restart_delay:
+                self._delays[index] = self.restart_delay
+            delay = self._delays.get(index, self.restart_delay)
+            self._delays[index] = min(delay * 2, self.max_restart_delay)
+            self._restart_at[index] = now + delay
+            LOGGER.error(
+                f"[Supervisor] - Worker {index}(shards {self.shard_groups[index]}) exited with code "
+                f"{process.exitcode}, restarting it in {delay:g}s"
+            )
+
+    def _start_worker(self, index: int) -> None:
+        shard_ids = self.shard_groups[index]
+        process = self._context.Process(
+            target=self._target,
+            args=(index, shard_ids, self.shard_count, len(self.shard_groups)),
+            name=f"dj_garo_worker_{index}",
+        )
+        process.start()
+        self._workers[index] = process
+        self._started_at[index] = monotonic()
+        LOGGER.info(
+            f"[Supervisor] - Started worker {index}(pid {process.pid}) with shards {shard_ids} of {self.shard_count}"
+        )
+
+    def _stop(self, *_) -> None:
+        self._stopping = True
+
+    def _stop_workers(self) -> None:
+        self._restart_at.clear()
+        for process in self._workers.values():
+            if process.is_alive():
+                process.terminate()
+        # The workers close their bots at the same time, they share one deadline
+        deadline = monotonic() + self.stop_timeout
+        for index, process in self._workers.items():
+            process.join(timeout=max(deadline - monotonic(), 0))
+            if process.is_alive():
+                LOGGER.warning(
+                    f"[Supervisor] - Worker {index} didn't stop within {self.stop_timeout:g}s, killing it"
+                )
+                process.kill()
+                process.join()
+        self._workers.clear()
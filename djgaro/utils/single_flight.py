@@ -0,0 +1,94 @@
+from asyncio import Future, ensure_future, gather, get_running_loop, shield
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    List,
+    TypeVar,
+)
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SingleFlight(Generic[K, V]):
+    """Coalesces concurrent calls for the same key into a single call whose result every caller gets.
+
+    Errors of the shared call are raised to every caller. A caller which is cancelled stops
+    waiting but doesn't cancel the shared call, the remaining callers still get its result.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[K, Future] = {}
+        # Calls which were answered by a call already in flight
+        self.coalesced = 0
+
+    async def run(self, key: K, function: Callable[[], Awaitable[V]]) -> V:
+        future = self._calls.get(key)
+        if future is None:
+            future = ensure_future(function())
+            self._track(key, future)
+        else:
+            self.coalesced += 1
+        return await shield(future)
+
+    async def run_many(
+        self,
+        keys: List[K],
+        function: Callable[[List[K]], Awaitable[Dict[K, V]]],
+    ) -> Dict[K, V]:
+        """Looks up many keys at once, `function` is called only with the keys not already in flight.
+
+        `function` returns the found values by key, keys it leaves out are missing from the result.
+        """
+
+        keys = list(dict.fromkeys(keys))
+        new_keys = [key for key in keys if key not in self._calls]
+        self.coalesced += len(keys) - len(new_keys)
+        if new_keys:
+            loop = get_running_loop()
+            futures = {key: loop.create_future() for key in new_keys}
+            for key, future in futures.items():
+                self._track(key, future)
+            batch = ensure_future(function(new_keys))
+            batch.add_done_callback(lambda _: self._settle(batch, futures))
+
+        values = await gather(*(shield(self._calls[key]) for key in keys))
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def in_flight(self, key: K) -> bool:
+        return key in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def _settle(self, batch: Future, futures: Dict[K, Future]) -> None:
+        if batch.cancelled():
+            for future in futures.values():
+                future.cancel()
+            return None
+
+        exc = batch.exception()
+        values = {} if exc else batch.result()
+        for key, future in futures.items():
+            if future.done():
+                continue
+            if exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(values.get(key))
+
+    def _track(self, key: K, future: Future) -> None:
+        self._calls[key] = future
+
+        def forget(done: Future) -> None:
+            if self._calls.get(key) is done:
+                del self._calls[key]
+            # Marks the error as retrieved even if every caller went away
+            if not done.cancelled():
+                done.exception()
+
+        future.add_done_callback(forget)
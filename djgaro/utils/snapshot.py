@@ -0,0 +1,146 @@
+from json import dumps as json_dumps, loads as json_loads
+import os
+from time import time
+from typing import Any, List, Optional
+from attr import dataclass
+from logging import getLogger
+
+from djgaro.utils.config import env_bool, env_str
+from djgaro.utils.constants import SNAPSHOT_PATH
+from djgaro.utils.player import GuildPlayer, LoopMode
+from djgaro.utils.song_queue import PlaylistItem
+
+
+LOGGER = getLogger("dj_garo")
+
+SNAPSHOT_VERSION = 1
+
+
+@dataclass(slots=True)
+class PlayerSnapshot(object):
+    """What is needed to pick a guild's session up again after a reload or restart"""
+
+    guild_id: int
+    voice_channel_id: Optional[int]
+    text_channel_id: Optional[int]
+    song_idx: int
+    repeat_mode: str
+    # Seconds of the current song played so far
+    position: float
+    # 'playing', 'paused' or 'stopped'
+    state: str
+    # Every song as [video_id, title, duration, raw_url, acodec, abr, failed]
+    items: List[List[Any]]
+
+    def playlist_items(self) -> List[PlaylistItem]:
+        return [PlaylistItem(*row) for row in self.items]
+
+    @property
+    def loop_mode(self) -> LoopMode:
+        return LoopMode[self.repeat_mode]
+
+
+def snapshot_player(player: GuildPlayer) -> Optional[PlayerSnapshot]:
+    """Captures the queue, cursor, loop mode and playback state of a player, None if its queue is empty"""
+
+    if not player.playlist:
+        return None
+
+    voice_client = player.voice_client
+    state = "stopped"
+    if voice_client and voice_client.is_playing():
+        state = "playing"
+    elif voice_client and voice_client.is_paused():
+        state = "paused"
+    channel = getattr(voice_client, "channel", None)
+    text_channel = player.text_channel
+    return PlayerSnapshot(
+        guild_id=player.guild_id,
+        voice_channel_id=channel.id if channel else None,
+        text_channel_id=text_channel.id if text_channel else None,
+        song_idx=player.song_idx,
+        repeat_mode=player.repeat_mode.name,
+        position=round(player.position, 1) if state != "stopped" else 0.0,
+        state=state,
+        items=[
+            [
+                item.video_id,
+                item.title,
+                item.duration,
+                item.raw_url,
+                item.acodec,
+                item.abr,
+                item.failed,
+            ]
+            for item in player.playlist
+        ],
+    )
+
+
+def save_snapshot(path: str, snapshots: List[PlayerSnapshot]) -> None:
+    """Writes the snapshots to `path`, replacing the previous file only once the new one is complete"""
+
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time(),
+        "players": [
+            {
+                "guild_id": snapshot.guild_id,
+                "voice_channel_id": snapshot.voice_channel_id,
+                "text_channel_id": snapshot.text_channel_id,
+                "song_idx": snapshot.song_idx,
+                "repeat_mode": snapshot.repeat_mode,
+                "position": snapshot.position,
+                "state": snapshot.state,
+                "items": snapshot.items,
+            }
+            for snapshot in snapshots
+        ],
+    }
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        file.write(json_dumps(data, separators=(",", ":"), ensure_ascii=False))
+    os.replace(temporary_path, path)
+
+
+def load_snapshot(path: str, max_age: float) -> List[PlayerSnapshot]:
+    """Reads and removes the snapshot file, snapshots older than `max_age` seconds are ignored"""
+
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            data = json_loads(file.read())
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as exc:
+        LOGGER.error(f"[Snapshot] - Reading {path} failed: {exc}")
+        return []
+    finally:
+        # A snapshot is restored at most once
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    age = time() - data.get("saved_at", 0)
+    if data.get("version") != SNAPSHOT_VERSION or age > max_age:
+        LOGGER.info(f"[Snapshot] - Ignoring the snapshot saved {age:.0f}s ago")
+        return []
+
+    try:
+        return [PlayerSnapshot(**player) for player in data["players"]]
+    except (KeyError, TypeError) as exc:
+        LOGGER.error(f"[Snapshot] - Invalid snapshot {path}: {exc}")
+        return []
+
+
+def snapshot_path(worker_index: Optional[int] = None) -> Optional[str]:
+    """Path of the snapshot file, None if DJGARO_SNAPSHOT turns snapshots off"""
+
+    if not env_bool("DJGARO_SNAPSHOT", True):
+        return None
+    path = env_str("DJGARO_SNAPSHOT_PATH", SNAPSHOT_PATH)
+    if worker_index is not None:
+        # Every worker saves and restores the guilds of its own shards
+        name, extension = os.path.splitext(path)
+        path = f"{name}.worker{worker_index}{extension}"
+    return path
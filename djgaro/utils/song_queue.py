@@ -0,0 +1,141 @@
+from random import shuffle as shuffle_in_place
+from typing import Dict, Iterable, Iterator, List, Optional
+from attr import dataclass
+
+from djgaro.utils.constants import YT_WEB_VIDEO_BASE_URL
+
+
+def format_duration(seconds: int) -> str:
+    """Formats a number of seconds like '1h 5m 30s'"""
+
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    parts = [f"{hours}h"] if hours else []
+    if minutes:
+        parts.append(f"{minutes}m")
+    if seconds:
+        parts.append(f"{seconds}s")
+    return " ".join(parts)
+
+
+@dataclass(slots=True)
+class PlaylistItem(object):
+    video_id: str = ""
+    title: str = ""
+    # Whole seconds, as reported by the youtube API
+    duration: int = 0
+    raw_url: str = ""
+    # Codec and bitrate(kbit/s) of the raw audio stream, as reported by the extractor
+    acodec: str = ""
+    abr: float = 0.0
+    # Set once the stream URL of the video could not be extracted
+    failed: bool = False
+
+    @property
+    def yt_url(self) -> str:
+        return YT_WEB_VIDEO_BASE_URL + self.video_id
+
+    @property
+    def duration_text(self) -> str:
+        return format_duration(self.duration)
+
+    def __str__(self) -> str:
+        return f"{self.title} - [{self.duration_text}] - {self.yt_url}"
+
+
+class SongQueue(object):
+    """Array backed queue of songs with a running total duration and skip links over failed songs.
+
+    Looking for the next or previous playable song follows links which jump over runs of
+    failed songs, and the links are shortened on every lookup, so repeated lookups cost
+    O(1) amortized no matter how many songs failed. Failed songs are expected to stay
+    failed, the links are dropped whenever songs are inserted, removed or reordered.
+
+    Appending is O(1). Inserting and removing are O(n): the songs behind the position are
+    shifted and the skip links are dropped, to be rebuilt by the following lookups. Songs are
+    addressed by their position(the cursor, !remove, !listsongs), which rules out O(1)
+    positional edits, but with at most PLAYLIST_MAX_ITEMS(5000) songs an insert or remove
+    takes a few microseconds.
+    """
+
+    def __init__(self, items: Iterable[PlaylistItem] = ()) -> None:
+        self._items: List[PlaylistItem] = []
+        self.total_duration = 0
+        # Index of a failed song -> an index further along(or back) with only failed songs in between
+        self._skip_forward: Dict[int, int] = {}
+        self._skip_backward: Dict[int, int] = {}
+        self.extend(items)
+
+    def append(self, item: PlaylistItem) -> None:
+        # Links point at most to the old end of the queue, appending keeps them valid
+        self._items.append(item)
+        self.total_duration += item.duration
+
+    def extend(self, items: Iterable[PlaylistItem]) -> None:
+        for item in items:
+            self.append(item)
+
+    def insert(self, index: int, item: PlaylistItem) -> None:
+        self._items.insert(index, item)
+        self.total_duration += item.duration
+        self._drop_links()
+
+    def remove(self, index: int) -> PlaylistItem:
+        item = self._items.pop(index)
+        self.total_duration -= item.duration
+        self._drop_links()
+        return item
+
+    def shuffle(self, first: Optional[int] = None) -> None:
+        """Shuffles the songs, the song at index `first`(if given) is moved to the front"""
+
+        head = [self._items.pop(first)] if first is not None else []
+        shuffle_in_place(self._items)
+        self._items[:0] = head
+        self._drop_links()
+
+    def next_playable(self, start: int, *, wrap: bool = False) -> Optional[int]:
+        """Returns the first index from `start` onwards whose song has not failed to resolve"""
+
+        start = max(start, 0)
+        index = self._follow_forward(start)
+        if index is None and wrap and start > 0:
+            index = self._follow_forward(0)
+            if index is not None and index >= start:
+                index = None
+        return index
+
+    def previous_playable(self, start: int) -> Optional[int]:
+        """Returns the last index up to `start` whose song has not failed to resolve"""
+        return self._follow_backward(min(start, len(self._items) - 1))
+
+    def _follow_forward(self, index: int) -> Optional[int]:
+        items, visited = self._items, []
+        while index < len(items) and items[index].failed:
+            visited.append(index)
+            index = self._skip_forward.get(index, index + 1)
+        for failed_index in visited:
+            self._skip_forward[failed_index] = index
+        return index if index < len(items) else None
+
+    def _follow_backward(self, index: int) -> Optional[int]:
+        items, visited = self._items, []
+        while index >= 0 and items[index].failed:
+            visited.append(index)
+            index = self._skip_backward.get(index, index - 1)
+        for failed_index in visited:
+            self._skip_backward[failed_index] = index
+        return index if index >= 0 else None
+
+    def _drop_links(self) -> None:
+        self._skip_forward.clear()
+        self._skip_backward.clear()
+
+    def __getitem__(self, index: int) -> PlaylistItem:
+        return self._items[index]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[PlaylistItem]:
+        return iter(self._items)
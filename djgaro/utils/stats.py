@@ -0,0 +1,204 @@
+from asyncio import CancelledError, Task, create_task, get_running_loop, sleep
+from bisect import bisect_left
+from contextlib import contextmanager
+import sys
+import threading
+from time import monotonic
+import traceback
+from typing import Dict, Iterator, List, Optional, Tuple
+from logging import getLogger
+
+from djgaro.utils.constants import LOOP_STALL_THRESHOLD, LOOP_WATCHDOG_INTERVAL
+
+
+LOGGER = getLogger("dj_garo")
+
+# Upper bounds(seconds) of the histogram buckets, roughly 1-2.5-5 steps from 1ms to 60s
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    20.0,
+    30.0,
+    60.0,
+)
+
+
+class LatencyHistogram(object):
+    """Fixed bucket latency histogram, percentiles are interpolated within a bucket"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # The last count is the overflow bucket(+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        if not self.count:
+            return 0.0
+
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = (
+                    min(self.buckets[index], self.max)
+                    if index < len(self.buckets)
+                    else self.max
+                )
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+
+
+class LatencyStats(object):
+    """Latency histograms of the named stages of the play path, overall and per guild"""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, LatencyHistogram] = {}
+        self.guild_stages: Dict[int, Dict[str, LatencyHistogram]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def observe(
+        self, stage: str, seconds: float, guild_id: Optional[int] = None
+    ) -> None:
+        self.stages.setdefault(stage, LatencyHistogram()).observe(seconds)
+        if guild_id is not None:
+            guild_stages = self.guild_stages.setdefault(guild_id, {})
+            guild_stages.setdefault(stage, LatencyHistogram()).observe(seconds)
+
+    def error(self, stage: str) -> None:
+        self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    @contextmanager
+    def timer(self, stage: str, guild_id: Optional[int] = None) -> Iterator[None]:
+        """Times the wrapped block, also when it raises(counted as an error) or is cancelled"""
+
+        start = monotonic()
+        try:
+            yield
+        except Exception:
+            self.error(stage)
+            raise
+        finally:
+            self.observe(stage, monotonic() - start, guild_id)
+
+    def forget_guild(self, guild_id: int) -> None:
+        self.guild_stages.pop(guild_id, None)
+
+    def summary(
+        self, guild_id: Optional[int] = None
+    ) -> List[Tuple[str, int, float, float, float]]:
+        """Returns (stage, count, p50, p95, p99) rows, overall or for a single guild"""
+
+        stages = (
+            self.stages if guild_id is None else self.guild_stages.get(guild_id, {})
+        )
+        return [
+            (
+                stage,
+                histogram.count,
+                histogram.percentile(0.50),
+                histogram.percentile(0.95),
+                histogram.percentile(0.99),
+            )
+            for stage, histogram in sorted(stages.items())
+        ]
+
+
+PLAY_STATS = LatencyStats()
+
+
+class LoopWatchdog(object):
+    """Measures event loop lag and reports when the loop is blocked longer than a threshold.
+
+    A heartbeat task records the lag of its own wake-ups, a separate thread notices when the
+    heartbeat stops and logs the stack the event loop thread is stuck in.
+    """
+
+    def __init__(
+        self,
+        stats: LatencyStats = PLAY_STATS,
+        interval: float = LOOP_WATCHDOG_INTERVAL,
+        threshold: float = LOOP_STALL_THRESHOLD,
+    ) -> None:
+        self.stats = stats
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = 0
+        self._last_beat = monotonic()
+        self._task: Optional[Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        if self._task is not None:
+            return None
+
+        self._stopped.clear()
+        self._last_beat = monotonic()
+        self._task = create_task(self._heartbeat())
+        self._thread = threading.Thread(
+            target=self._watch,
+            args=(threading.get_ident(),),
+            name="dj_garo_loop_watchdog",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        loop = get_running_loop()
+        try:
+            while True:
+                expected = loop.time() + self.interval
+                await sleep(self.interval)
+                lag = max(loop.time() - expected, 0.0)
+                self.stats.observe("event_loop_lag", lag)
+                self._last_beat = monotonic()
+        except CancelledError:
+            pass
+
+    def _watch(self, loop_thread_id: int) -> None:
+        reported_beat = None
+        while not self._stopped.wait(self.interval):
+            last_beat = self._last_beat
+            blocked_for = monotonic() - last_beat
+            if (
+                blocked_for < self.threshold + self.interval
+                or reported_beat == last_beat
+            ):
+                continue
+
+            # Report every stall once, with the stack the loop is currently stuck in
+            reported_beat = last_beat
+            self.stalls += 1
+            frame = sys._current_frames().get(loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            LOGGER.warning(
+                f"[Loop Watchdog] - Event loop blocked for {blocked_for:.2f}s:\n{stack}"
+            )
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from time import time
+from typing import Optional, Tuple
+from urllib import parse
+
+from djgaro.utils.extraction import StreamInfo
+from djgaro.utils.constants import (
+    STREAM_URL_CACHE_SIZE,
+    STREAM_URL_DEFAULT_TTL,
+    STREAM_URL_MIN_VALIDITY,
+    STREAM_URL_REFRESH_MARGIN,
+)
+
+
+def url_expiry(raw_url: str, default_ttl: float = STREAM_URL_DEFAULT_TTL) -> float:
+    """Returns the unix timestamp at which a googlevideo stream URL stops working"""
+
+    query_params = parse.parse_qs(parse.urlparse(raw_url).query)
+    try:
+        return float(query_params["expire"][0])
+    except (KeyError, IndexError, ValueError):
+        return time() + default_ttl
+
+
+class StreamUrlCache(object):
+    """Bounded LRU cache of resolved audio streams keyed by youtube video ID.
+
+    Entries live until the 'expire' timestamp embedded in the URL. Entries within
+    `min_validity` seconds of expiring are treated as missing, entries within
+    `refresh_margin` seconds are still served but reported by `expires_soon`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = STREAM_URL_CACHE_SIZE,
+        refresh_margin: float = STREAM_URL_REFRESH_MARGIN,
+        min_validity: float = STREAM_URL_MIN_VALIDITY,
+    ) -> None:
+        self.max_entries = max_entries
+        self.refresh_margin = refresh_margin
+        self.min_validity = min_validity
+        self._entries: OrderedDict[str, Tuple[StreamInfo, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, video_id: str) -> Optional[StreamInfo]:
+        entry = self._entries.get(video_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stream_info, expires_at = entry
+        if expires_at - time() <= self.min_validity:
+            del self._entries[video_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(video_id)
+        self.hits += 1
+        return stream_info
+
+    def put(self, video_id: str, stream_info: StreamInfo) -> None:
+        if not video_id or not stream_info.url or self.max_entries <= 0:
+            return None
+
+        self._entries[video_id] = (stream_info, url_expiry(stream_info.url))
+        self._entries.move_to_end(video_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def is_usable(self, raw_url: str) -> bool:
+        """Checks whether a URL obtained elsewhere is still far enough from expiring"""
+        return bool(raw_url) and url_expiry(raw_url) - time() > self.min_validity
+
+    def expires_soon(self, video_id: str) -> bool:
+        entry = self._entries.get(video_id)
+        return entry is not None and entry[1] - time() <= self.refresh_margin
+
+    def discard(self, video_id: str) -> None:
+        self._entries.pop(video_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)